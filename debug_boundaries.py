@@ -4,9 +4,14 @@
 import sys
 import os
 import asyncio
+import orjson
 import osmium
-import json
-from pathlib import Path
+import shapely
+import shutil
+import subprocess
+import tempfile
+from dataclasses import dataclass
+from typing import Optional
 import logging
 
 # Configuration du logging détaillé
@@ -16,174 +21,178 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Index des positions de nodes: tableau dense mappé sur disque (C++), bien plus
+# compact qu'un dict Python pour les gros fichiers (continent/planète)
+NODE_LOCATIONS_INDEX = "dense_file_array"
 
-class BoundaryDebugger(osmium.SimpleHandler):
-    """Debugger spécialisé pour analyser les frontières OSM."""
+# Précision des coordonnées exportées (6 décimales ≈ 11 cm)
+COORD_DECIMALS = 6
 
-    def __init__(self, target_country_name=None):
-        osmium.SimpleHandler.__init__(self)
-        self.target_country_name = target_country_name.lower() if target_country_name else None
-        self.countries_found = []
-        self.nodes_cache = {}
-        self.ways_cache = {}
-        self.current_country = None
-        self.debug_mode = True
+# Fichier de sortie unique des frontières (GeoJSON Text Sequence)
+BOUNDARIES_OUTPUT = "debug_boundaries.geojsonseq"
 
-    def node(self, n):
-        """Cache tous les nodes."""
-        self.nodes_cache[n.id] = (n.location.lon, n.location.lat)
 
-    def way(self, w):
-        """Cache tous les ways."""
-        node_refs = [node.ref for node in w.nodes]
-        self.ways_cache[w.id] = node_refs
+def _country_filters(entities):
+    """Filtres C++ boundary=administrative ET admin_level=2 pour les entités données."""
+    return [
+        osmium.filter.TagFilter(('boundary', 'administrative')).enable_for(entities),
+        osmium.filter.TagFilter(('admin_level', '2')).enable_for(entities),
+    ]
 
-    def relation(self, r):
-        """Analyse les relations pays."""
-        if (r.tags.get('boundary') == 'administrative' and
-            r.tags.get('admin_level') == '2'):
-
-            name = r.tags.get('name', f'Country {r.id}')
-            code = r.tags.get('ISO3166-1:alpha2', 'N/A')
-
-            # Filtrer par nom si spécifié
-            if self.target_country_name and self.target_country_name not in name.lower():
-                return
-
-            logger.info(f"\n=== PAYS TROUVÉ ===")
-            logger.info(f"Nom: {name}")
-            logger.info(f"ID OSM: {r.id}")
-            logger.info(f"Code ISO: {code}")
-
-            # Analyser les membres
-            ways_outer = []
-            ways_inner = []
-            relations = []
-
-            for member in r.members:
-                if member.type == 'w':  # Way
-                    if member.role == 'inner':
-                        ways_inner.append(member.ref)
-                    else:  # outer ou pas de rôle
-                        ways_outer.append(member.ref)
-                elif member.type == 'r':  # Relation
-                    relations.append(member.ref)
-
-            logger.info(f"Ways outer: {len(ways_outer)}")
-            logger.info(f"Ways inner: {len(ways_inner)}")
-            logger.info(f"Relations: {len(relations)}")
-
-            if ways_outer:
-                logger.info(f"Premiers ways outer: {ways_outer[:5]}")
-
-            # Essayer de construire la géométrie
-            boundary = self._build_boundary_debug(ways_outer, ways_inner, name)
-
-            self.countries_found.append({
-                'id': r.id,
-                'name': name,
-                'code': code,
-                'boundary': boundary,
-                'ways_outer': len(ways_outer),
-                'ways_inner': len(ways_inner)
-            })
-
-    def _build_boundary_debug(self, ways_outer, ways_inner, country_name):
-        """Construction de frontière avec debug détaillé."""
-        logger.info(f"\n--- Construction frontière pour {country_name} ---")
-
-        if not ways_outer:
-            logger.warning("Aucun way outer trouvé")
-            return None
-
-        # Vérifier la disponibilité des ways
-        available_ways = 0
-        total_coords = 0
-
-        way_coordinates = {}
-
-        for way_id in ways_outer[:10]:  # Limiter pour le debug
-            if way_id in self.ways_cache:
-                node_refs = self.ways_cache[way_id]
-                coords = []
-
-                for node_ref in node_refs:
-                    if node_ref in self.nodes_cache:
-                        coords.append(self.nodes_cache[node_ref])
-
-                if coords:
-                    way_coordinates[way_id] = coords
-                    available_ways += 1
-                    total_coords += len(coords)
-                    logger.info(f"Way {way_id}: {len(coords)} coordonnées")
-
-                    # Afficher quelques coordonnées pour debug
-                    if len(coords) >= 2:
-                        logger.info(f"  Premier point: {coords[0]}")
-                        logger.info(f"  Dernier point: {coords[-1]}")
-                else:
-                    logger.warning(f"Way {way_id}: aucune coordonnée trouvée")
-            else:
-                logger.warning(f"Way {way_id}: non trouvé dans le cache")
 
-        logger.info(f"Ways disponibles: {available_ways}/{len(ways_outer[:10])}")
-        logger.info(f"Total coordonnées: {total_coords}")
+@dataclass(slots=True)
+class CountryRecord:
+    """Pays trouvé (objet à slots, plus compact qu'un dict par pays)."""
+    id: int
+    name: str
+    code: str
+    boundary: Optional[str] = None
+    ways_outer: int = 0
+    ways_inner: int = 0
 
-        if not way_coordinates:
-            logger.error("Aucun way utilisable trouvé")
-            return None
 
-        # Construire un polygone simple (concaténation)
-        try:
-            all_coords = []
-            for way_id, coords in way_coordinates.items():
-                all_coords.extend(coords)
-                logger.info(f"Ajouté way {way_id}: {len(coords)} points")
+class BoundaryDebugger:
+    """Debugger spécialisé pour analyser les frontières OSM."""
 
-            logger.info(f"Total points concaténés: {len(all_coords)}")
+    def __init__(self, target_country_name=None, list_only=False):
+        self.target_country_name = target_country_name.lower() if target_country_name else None
+        self.list_only = list_only  # Liste des pays seule: ni positions de nodes ni surfaces
+        self.countries_found = []
+        self.boundaries = {}
+        self.factory = osmium.geom.WKBFactory()
+        self.current_country = None
+        self.debug_mode = True
 
-            if len(all_coords) < 3:
-                logger.error("Pas assez de points pour un polygone")
-                return None
+    def process_file(self, osm_file, idx=NODE_LOCATIONS_INDEX):
+        """Parcourt le fichier: seules les relations pays et leurs surfaces remontent en Python.
+
+        L'assemblage des anneaux (outer/inner) est fait par le gestionnaire de
+        multipolygones d'osmium, en C++, à partir de l'index de positions.
+        """
+        if self.list_only:
+            country_entities = osmium.osm.RELATION
+            processor = osmium.FileProcessor(osm_file, osmium.osm.RELATION)
+        else:
+            country_entities = osmium.osm.RELATION | osmium.osm.AREA
+            processor = (
+                osmium.FileProcessor(osm_file)
+                .with_locations(idx)
+                .with_areas(*_country_filters(osmium.osm.RELATION))
+            )
+        processor = processor.with_filter(osmium.filter.EntityFilter(country_entities))
+        for tag_filter in _country_filters(country_entities):
+            processor = processor.with_filter(tag_filter)
+
+        for obj in processor:
+            if obj.is_area():
+                self.area(obj)
+            else:
+                self.relation(obj)
 
-            # Supprimer les doublons consécutifs
-            unique_coords = [all_coords[0]]
-            for coord in all_coords[1:]:
-                if coord != unique_coords[-1]:
-                    unique_coords.append(coord)
+        if self.list_only:
+            return
 
-            logger.info(f"Points uniques: {len(unique_coords)}")
+        # Les surfaces peuvent être émises avant leur relation: association en fin de lecture
+        for country in self.countries_found:
+            country.boundary = self.boundaries.get(country.id)
 
-            # Fermer le polygone
-            if unique_coords[0] != unique_coords[-1]:
-                unique_coords.append(unique_coords[0])
+    def _is_target(self, name):
+        """Vérifie si le pays correspond au filtre par nom."""
+        return not self.target_country_name or self.target_country_name in name.lower()
 
-            # Vérifier la validité
-            if len(unique_coords) < 4:
-                logger.error(f"Polygone invalide: {len(unique_coords)} points")
-                return None
+    def area(self, a):
+        """Construit le GeoJSON d'une surface issue d'une relation pays.
 
-            # Créer le GeoJSON
-            geojson = {
-                "type": "Polygon",
-                "coordinates": [[[lon, lat] for lon, lat in unique_coords]]
-            }
+        Le multipolygone assemblé par osmium est arrondi à COORD_DECIMALS
+        décimales (points devenus doublons fusionnés) avant export.
+        """
+        if a.from_way():
+            return
 
-            logger.info(f"✅ Polygone créé avec {len(unique_coords)} points")
+        name = a.tags.get('name', f'Country {a.orig_id()}')
+        if not self._is_target(name):
+            return
 
-            # Calculer les limites (bounding box)
-            lons = [coord[0] for coord in unique_coords]
-            lats = [coord[1] for coord in unique_coords]
+        try:
+            geom = shapely.from_wkb(self.factory.create_multipolygon(a))
+            geom = shapely.set_precision(geom, 10 ** -COORD_DECIMALS)
+            self.boundaries[a.orig_id()] = shapely.to_geojson(geom)
+            outer_rings, inner_rings = a.num_rings()
+            logger.info(f"✅ Multipolygone créé pour {name}: "
+                        f"{outer_rings} anneaux outer, {inner_rings} inner")
+        except Exception as e:
+            logger.error(f"Erreur construction multipolygone {name}: {e}")
 
-            logger.info(f"Bounding box:")
-            logger.info(f"  Longitude: {min(lons):.4f} à {max(lons):.4f}")
-            logger.info(f"  Latitude: {min(lats):.4f} à {max(lats):.4f}")
+    def relation(self, r):
+        """Analyse les relations pays (déjà filtrées par tags côté C++)."""
+        name = r.tags.get('name', f'Country {r.id}')
+        code = r.tags.get('ISO3166-1:alpha2', 'N/A')
+
+        if self.list_only:
+            self.countries_found.append(CountryRecord(r.id, name, code))
+            return
+
+        # Filtrer par nom si spécifié
+        if not self._is_target(name):
+            return
+
+        logger.info(f"\n=== PAYS TROUVÉ ===")
+        logger.info(f"Nom: {name}")
+        logger.info(f"ID OSM: {r.id}")
+        logger.info(f"Code ISO: {code}")
+
+        # Analyser les membres
+        ways_outer = []
+        ways_inner = []
+        relations = []
+
+        for member in r.members:
+            if member.type == 'w':  # Way
+                if member.role == 'inner':
+                    ways_inner.append(member.ref)
+                else:  # outer ou pas de rôle
+                    ways_outer.append(member.ref)
+            elif member.type == 'r':  # Relation
+                relations.append(member.ref)
+
+        logger.info(f"Ways outer: {len(ways_outer)}")
+        logger.info(f"Ways inner: {len(ways_inner)}")
+        logger.info(f"Relations: {len(relations)}")
+
+        if ways_outer:
+            logger.info(f"Premiers ways outer: {ways_outer[:5]}")
+
+        self.countries_found.append(CountryRecord(r.id, name, code, None, len(ways_outer), len(ways_inner)))
+
+
+def prefilter_pbf(osm_file, output_dir, omit_referenced=False):
+    """Pré-filtre le fichier avec osmium-tool pour ne garder que les relations pays.
+
+    Le filtrage se fait en C++ (`osmium tags-filter`), ce qui évite de faire
+    remonter en Python les milliards de nodes/ways inutiles d'un gros fichier.
+    Les ways et nodes référencés par les relations sont conservés, sauf si
+    `omit_referenced` est vrai. Retourne le fichier d'origine si osmium-tool
+    n'est pas disponible.
+    """
+    osmium_tool = shutil.which("osmium")
+    if not osmium_tool:
+        logger.warning("⚠️ osmium-tool introuvable, lecture du fichier complet")
+        return osm_file
+
+    filtered_file = os.path.join(output_dir, "boundaries.osm.pbf")
+    cmd = [osmium_tool, "tags-filter", "--overwrite", "-o", filtered_file]
+    if omit_referenced:
+        cmd.append("--omit-referenced")
+    cmd += [osm_file, "r/admin_level=2"]
 
-            return json.dumps(geojson)
+    try:
+        subprocess.run(cmd, check=True, capture_output=True)
+    except subprocess.CalledProcessError as e:
+        logger.warning(f"⚠️ Échec du pré-filtrage: {e.stderr.decode(errors='replace').strip()}")
+        return osm_file
 
-        except Exception as e:
-            logger.error(f"Erreur construction polygone: {e}")
-            return None
+    logger.info(f"✂️ Fichier pré-filtré: {os.path.getsize(filtered_file) / (1024*1024):.1f} MB")
+    return filtered_file
 
 
 def debug_boundaries(osm_file, country_name=None):
@@ -205,32 +214,36 @@ def debug_boundaries(osm_file, country_name=None):
 
     try:
         logger.info("📖 Lecture du fichier OSM...")
-        debugger.apply_file(osm_file)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            source_file = prefilter_pbf(osm_file, tmp_dir)
+            index = f"{NODE_LOCATIONS_INDEX},{os.path.join(tmp_dir, 'nodes.cache')}"
+            debugger.process_file(source_file, index)
 
         # Résultats
         logger.info(f"\n📊 RÉSULTATS:")
         logger.info(f"Pays trouvés: {len(debugger.countries_found)}")
-        logger.info(f"Nodes en cache: {len(debugger.nodes_cache):,}")
-        logger.info(f"Ways en cache: {len(debugger.ways_cache):,}")
-
-        # Détails par pays
-        for country in debugger.countries_found:
-            logger.info(f"\n🏳️ {country['name']} ({country['code']})")
-            logger.info(f"   ID: {country['id']}")
-            logger.info(f"   Ways outer: {country['ways_outer']}")
-            logger.info(f"   Ways inner: {country['ways_inner']}")
-
-            if country['boundary']:
-                logger.info(f"   ✅ Frontière construite")
-
-                # Sauvegarder pour inspection
-                filename = f"debug_boundary_{country['code']}_{country['id']}.geojson"
-                with open(filename, 'w') as f:
-                    geom = json.loads(country['boundary'])
-                    json.dump(geom, f, indent=2)
-                logger.info(f"   💾 Sauvegardé: {filename}")
-            else:
-                logger.info(f"   ❌ Échec construction frontière")
+
+        # Détails par pays, frontières regroupées dans un seul fichier
+        # GeoJSON Text Sequence (RFC 8142): une Feature \x1e<json>\n par pays,
+        # identifiée par ses propriétés id, name et code
+        with open(BOUNDARIES_OUTPUT, 'wb') as out:
+            for country in debugger.countries_found:
+                logger.info(f"\n🏳️ {country.name} ({country.code})")
+                logger.info(f"   ID: {country.id}")
+                logger.info(f"   Ways outer: {country.ways_outer}")
+                logger.info(f"   Ways inner: {country.ways_inner}")
+
+                if country.boundary:
+                    logger.info(f"   ✅ Frontière construite")
+
+                    # Sauvegarder pour inspection (géométrie déjà sérialisée, insérée telle quelle)
+                    properties = orjson.dumps({'id': country.id, 'name': country.name, 'code': country.code})
+                    out.write(b'\x1e{"type":"Feature","id":%d,"properties":%s,"geometry":%s}\n' % (
+                        country.id, properties, country.boundary.encode('utf-8')
+                    ))
+                    logger.info(f"   💾 Sauvegardé: {BOUNDARIES_OUTPUT}")
+                else:
+                    logger.info(f"   ❌ Échec construction frontière")
 
         if not debugger.countries_found:
             logger.warning("⚠️ Aucun pays trouvé. Suggestions:")
@@ -247,32 +260,15 @@ def quick_country_list(osm_file):
     """Liste rapide des pays dans le fichier."""
     logger.info(f"📋 Liste des pays dans {osm_file}")
 
-    class QuickLister(osmium.SimpleHandler):
-        def __init__(self):
-            osmium.SimpleHandler.__init__(self)
-            self.countries = []
-
-        def relation(self, r):
-            if (r.tags.get('boundary') == 'administrative' and
-                r.tags.get('admin_level') == '2'):
-
-                name = r.tags.get('name', f'Country {r.id}')
-                code = r.tags.get('ISO3166-1:alpha2', 'N/A')
-
-                self.countries.append({
-                    'name': name,
-                    'code': code,
-                    'id': r.id
-                })
-
-    lister = QuickLister()
-    lister.apply_file(osm_file)
+    lister = BoundaryDebugger(list_only=True)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        lister.process_file(prefilter_pbf(osm_file, tmp_dir, omit_referenced=True))
 
-    logger.info(f"Pays trouvés: {len(lister.countries)}")
-    for country in sorted(lister.countries, key=lambda x: x['name']):
-        print(f"  {country['name']} ({country['code']}) - ID: {country['id']}")
+    logger.info(f"Pays trouvés: {len(lister.countries_found)}")
+    for country in sorted(lister.countries_found, key=lambda x: x.name):
+        print(f"  {country.name} ({country.code}) - ID: {country.id}")
 
-    return lister.countries
+    return lister.countries_found
 
 
 if __name__ == "__main__":
@@ -1,7 +1,13 @@
+import functools
+import os
 from typing import List, Dict, Any, Optional
 from pydantic import BaseModel, Field
 import yaml
 
+# Loader/Dumper libyaml (C) si disponibles, sinon implémentation Python
+_YAML_LOADER = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+_YAML_DUMPER = getattr(yaml, 'CSafeDumper', yaml.SafeDumper)
+
 
 class DatabaseConfig(BaseModel):
     host: str = "localhost"
@@ -45,22 +51,30 @@ class Config(BaseModel):
     def from_yaml(cls, config_path: str) -> "Config":
         """Charge la configuration depuis un fichier YAML."""
         try:
-            with open(config_path, 'r', encoding='utf-8') as f:
-                data = yaml.safe_load(f)
-
-            # Gérer l'alias 'import' -> 'import_'
-            if 'import' in data:
-                data['import_'] = data.pop('import')
-
-            return cls(**data)
+            # Le mtime fait partie de la clé: une modification du fichier invalide le cache
+            config = cls._from_yaml_cached(config_path, os.path.getmtime(config_path))
+            return config.model_copy(deep=True)
         except FileNotFoundError:
             print(f"Fichier de configuration introuvable: {config_path}")
             print("Création d'un fichier de configuration par défaut...")
             default_config = cls._create_default_config()
             with open(config_path, 'w', encoding='utf-8') as f:
-                yaml.dump(default_config, f, default_flow_style=False)
+                yaml.dump(default_config, f, Dumper=_YAML_DUMPER, default_flow_style=False)
             return cls(**default_config)
 
+    @classmethod
+    @functools.lru_cache(maxsize=16)
+    def _from_yaml_cached(cls, config_path: str, mtime: float) -> "Config":
+        """Lecture + validation du YAML, mémorisées par (chemin, mtime)."""
+        with open(config_path, 'r', encoding='utf-8') as f:
+            data = yaml.load(f, Loader=_YAML_LOADER)
+
+        # Gérer l'alias 'import' -> 'import_'
+        if 'import' in data:
+            data['import_'] = data.pop('import')
+
+        return cls(**data)
+
     @staticmethod
     def _create_default_config() -> Dict[str, Any]:
         """Crée une configuration par défaut."""
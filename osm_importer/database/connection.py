@@ -1,13 +1,20 @@
+import asyncio
 import asyncpg
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
 from sqlalchemy import text
 from contextlib import asynccontextmanager
 from typing import AsyncGenerator
 import logging
+import orjson
 
 logger = logging.getLogger(__name__)
 
 
+def _json_serializer(value) -> str:
+    """Sérialise les valeurs JSONB avec orjson."""
+    return orjson.dumps(value).decode()
+
+
 class DatabaseManager:
     """Gestionnaire de connexions à la base de données."""
 
@@ -27,9 +34,18 @@ class DatabaseManager:
         self.engine = create_async_engine(
             db_url,
             echo=False,
-            pool_size=20,
+            # Au moins une connexion par batch d'upsert concurrent
+            pool_size=max(20, self.config.import_.num_workers),
             max_overflow=30,
-            pool_pre_ping=True
+            pool_pre_ping=True,
+            json_serializer=_json_serializer,
+            json_deserializer=orjson.loads,
+            # Les mêmes UPSERT/MERGE sont rejoués à chaque batch: on garde
+            # davantage d'instructions préparées par connexion (SQLAlchemy et asyncpg)
+            connect_args={
+                'prepared_statement_cache_size': 500,
+                'statement_cache_size': 500,
+            }
         )
 
         self.session_factory = async_sessionmaker(
@@ -45,29 +61,59 @@ class DatabaseManager:
         from ..models import Base
         async with self.engine.begin() as conn:
             await conn.run_sync(Base.metadata.create_all)
+
+            # Bases créées avant le passage de boundaries en JSONB
+            result = await conn.execute(text(
+                "SELECT data_type FROM information_schema.columns "
+                "WHERE table_name = 'countries' AND column_name = 'boundaries'"
+            ))
+            if result.scalar() == 'text':
+                await conn.execute(text(
+                    "ALTER TABLE countries ALTER COLUMN boundaries TYPE jsonb USING boundaries::jsonb"
+                ))
+
+            # Colonne géométrique indexée pour la liaison spatiale, si PostGIS est installé
+            result = await conn.execute(text("SELECT 1 FROM pg_extension WHERE extname = 'postgis'"))
+            if result.first() is not None:
+                await conn.execute(text(
+                    "ALTER TABLE countries ADD COLUMN IF NOT EXISTS boundary_geom geometry(MultiPolygon, 4326)"
+                ))
+                await conn.execute(text(
+                    "CREATE INDEX IF NOT EXISTS idx_countries_boundary_geom ON countries USING GIST(boundary_geom)"
+                ))
         logger.info("Tables créées")
 
     async def create_indexes(self):
-        """Crée les index pour optimiser les performances."""
+        """Crée les index pour optimiser les performances (en parallèle)."""
         indexes = [
             "CREATE INDEX IF NOT EXISTS idx_countries_osm_id ON countries(osm_id);",
             "CREATE INDEX IF NOT EXISTS idx_countries_alpha2 ON countries(country_code_alpha2);",
             "CREATE INDEX IF NOT EXISTS idx_cities_osm_id ON cities(osm_id);",
             "CREATE INDEX IF NOT EXISTS idx_cities_country_id ON cities(country_id);",
-            "CREATE INDEX IF NOT EXISTS idx_cities_coords ON cities(center_lat, center_lng);"
+            # BRIN: bien plus petit et rapide à construire qu'un B-tree sur des coordonnées
+            "CREATE INDEX IF NOT EXISTS idx_cities_coords_brin ON cities "
+            "USING BRIN(center_lat, center_lng) WITH (pages_per_range = 32);"
         ]
 
-        # Créer les index en dehors des transactions
-        for index_sql in indexes:
-            try:
-                # Utiliser une connexion directe pour éviter les transactions
-                async with self.engine.connect() as conn:
-                    # Autocommit pour les index
-                    await conn.execute(text(index_sql))
-                    await conn.commit()
-                logger.info(f"Index créé: {index_sql.split()[5]}")  # Nom de l'index
-            except Exception as e:
-                logger.warning(f"Erreur création index: {e}")
+        # Ancien B-tree sur les coordonnées (même nom autrefois), remplacé par le BRIN
+        async with self.engine.connect() as conn:
+            conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+            await conn.execute(text("DROP INDEX IF EXISTS idx_cities_coords"))
+
+        # Construction simultanée sur des connexions séparées: durée ≈ max au lieu de la somme.
+        # Pas de CONCURRENTLY: aucune écriture en cours à cette étape, et deux
+        # CREATE INDEX CONCURRENTLY sur la même table se sérialisent.
+        await asyncio.gather(*(self._create_index(index_sql) for index_sql in indexes))
+
+    async def _create_index(self, index_sql: str):
+        """Crée un index sur sa propre connexion, hors transaction."""
+        try:
+            async with self.engine.connect() as conn:
+                conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+                await conn.execute(text(index_sql))
+            logger.info(f"Index créé: {index_sql.split()[5]}")  # Nom de l'index
+        except Exception as e:
+            logger.warning(f"Erreur création index: {e}")
 
     @asynccontextmanager
     async def get_session(self) -> AsyncGenerator[AsyncSession, None]:
@@ -1,13 +1,27 @@
-from sqlalchemy import select, update, and_, func, text
+from sqlalchemy import Text, select, and_, text, literal_column
 from sqlalchemy.dialects.postgresql import insert
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Sequence, Tuple
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 import logging
-import json
-from shapely.geometry import Point, Polygon, MultiPolygon
-from shapely.ops import unary_union
+import os
+import numpy as np
+import shapely
+from shapely.geometry import Point
+from shapely.strtree import STRtree
 
 logger = logging.getLogger(__name__)
 
+# Pas (en degrés) de la grille de pré-affectation des points aux pays
+GRID_RESOLUTION = 0.5
+
+# GeoJSON (colonne boundaries) -> geometry(MultiPolygon, 4326) valide
+BOUNDARY_GEOM_SQL = """ST_Multi(ST_CollectionExtract(
+    ST_MakeValid(ST_SetSRID(ST_GeomFromGeoJSON(boundaries), 4326)), 3))"""
+
+# Exclut les frontières absentes ou vides ({"coordinates":[[]]} de l'import rapide)
+HAS_BOUNDARY_SQL = "boundaries IS NOT NULL AND (boundaries::jsonb #> '{coordinates,0,0}') IS NOT NULL"
+
 
 class DatabaseOperations:
     """Opérations de base de données avec liaison géométrique précise."""
@@ -15,6 +29,11 @@ class DatabaseOperations:
     def __init__(self, db_manager):
         self.db_manager = db_manager
         self.country_geometries = {}  # Cache des géométries
+        self._strtree = None  # Index spatial des géométries des pays
+        self._strtree_ids = []  # Position dans le STRtree -> id du pays
+        self._grid = None  # Cellule de grille -> position dans le STRtree (-1: ambiguë)
+        self._postgis = None  # Extension PostGIS disponible (détectée à la première liaison)
+        self._upsert_statements = {}  # (modèle, colonnes) -> INSERT ... ON CONFLICT compilé une fois
 
     async def upsert_countries(self, countries_data: List[Dict[str, Any]]) -> Dict[str, int]:
         """Insert ou update des pays par batch."""
@@ -24,32 +43,18 @@ class DatabaseOperations:
 
         async with self.db_manager.get_session() as session:
             try:
-                for country_data in countries_data:
-                    try:
-                        # Requête UPSERT PostgreSQL
-                        stmt = insert(Country).values(**country_data)
-
-                        # ON CONFLICT DO UPDATE
-                        update_dict = {k: v for k, v in country_data.items()
-                                     if k not in ['id', 'osm_id', 'created_at']}
-                        update_dict['updated_at'] = stmt.excluded.updated_at
-
-                        stmt = stmt.on_conflict_do_update(
-                            index_elements=['osm_id'],
-                            set_=update_dict
-                        )
-
-                        result = await session.execute(stmt)
-
-                        if result.rowcount > 0:
-                            stats['inserted'] += 1
-                        else:
-                            stats['updated'] += 1
-
-                    except Exception as e:
-                        logger.error(f"Erreur upsert pays {country_data.get('osm_id')}: {e}")
-                        stats['errors'] += 1
-                        continue
+                await self._upsert_rows(session, Country, countries_data, stats)
+
+                # Géométrie PostGIS calculée dans la même transaction que le GeoJSON
+                if await self._postgis_available():
+                    await session.execute(
+                        text(f"""
+                        UPDATE countries
+                        SET boundary_geom = CASE WHEN {HAS_BOUNDARY_SQL} THEN {BOUNDARY_GEOM_SQL} END
+                        WHERE osm_id = ANY(CAST(:osm_ids AS bigint[]))
+                        """),
+                        {'osm_ids': [row['osm_id'] for row in countries_data]}
+                    )
 
                 await session.commit()
 
@@ -61,291 +66,557 @@ class DatabaseOperations:
         return stats
 
     async def upsert_cities(self, cities_data: List[Dict[str, Any]]) -> Dict[str, int]:
-        """Insert ou update des villes par batch."""
-        from ..models import City
+        """Insert ou update des villes par batch (lignes en dicts), via `copy_cities`.
 
+        Les lignes sont regroupées par jeu de clés: une clé absente n'est pas
+        copiée en NULL (qui écraserait la valeur existante au conflit).
+        """
         stats = {'inserted': 0, 'updated': 0, 'errors': 0}
+        groups = defaultdict(list)
+        for row in cities_data:
+            groups[tuple(sorted(row))].append(row)
 
-        async with self.db_manager.get_session() as session:
-            try:
-                for city_data in cities_data:
-                    try:
-                        stmt = insert(City).values(**city_data)
+        for columns, group in groups.items():
+            group_stats = await self.copy_cities({col: [row[col] for row in group] for col in columns})
+            for key, value in group_stats.items():
+                stats[key] += value
 
-                        update_dict = {k: v for k, v in city_data.items()
-                                     if k not in ['id', 'osm_id', 'created_at']}
-                        update_dict['updated_at'] = stmt.excluded.updated_at
-
-                        stmt = stmt.on_conflict_do_update(
-                            index_elements=['osm_id'],
-                            set_=update_dict
-                        )
-
-                        result = await session.execute(stmt)
-
-                        if result.rowcount > 0:
-                            stats['inserted'] += 1
-                        else:
-                            stats['updated'] += 1
+        return stats
 
-                    except Exception as e:
-                        logger.error(f"Erreur upsert ville {city_data.get('osm_id')}: {e}")
-                        stats['errors'] += 1
-                        continue
+    async def copy_cities(self, columns: Dict[str, Sequence[Any]]) -> Dict[str, int]:
+        """Insert ou update des villes données par colonnes, via COPY binaire dans une table de staging.
 
-                await session.commit()
+        Plus rapide que l'INSERT multi-lignes pour les millions de villes: les lignes
+        sont copiées dans une table temporaire (sans WAL) puis fusionnées dans
+        `cities` par un unique INSERT ... SELECT ... ON CONFLICT DO UPDATE. Les
+        enregistrements sont formés directement à partir des colonnes (sans dicts).
+        """
+        from ..models import City
 
-            except Exception as e:
-                await session.rollback()
-                logger.error(f"Erreur batch cities: {e}")
-                stats['errors'] += len(cities_data)
+        stats = {'inserted': 0, 'updated': 0, 'errors': 0}
+        count = len(columns.get('osm_id', ()))
+        if not count:
+            return stats
+
+        table_columns = set(City.__table__.columns.keys()) - {'id', 'created_at', 'updated_at'}
+        names = [col for col in columns if col in table_columns]
+        stage_columns = ', '.join(sorted(table_columns))
+        records = list(zip(*(columns[col] for col in names)))
+
+        column_list = ', '.join(names)
+        update_list = ', '.join([
+            *(f"{col} = EXCLUDED.{col}" for col in names if col != 'osm_id'),
+            'updated_at = EXCLUDED.updated_at',
+        ])
+        merge_sql = f"""
+            INSERT INTO cities ({column_list}, created_at, updated_at)
+            SELECT {column_list}, now(), now() FROM cities_stage
+            ON CONFLICT (osm_id) DO UPDATE SET {update_list}
+            RETURNING xmax = 0 AS inserted
+        """
+
+        try:
+            async with self.db_manager.engine.connect() as conn:
+                raw = await conn.get_raw_connection()
+                driver = raw.driver_connection
+
+                async with driver.transaction():
+                    # Table temporaire par connexion: pas de WAL, pas de conflit entre batchs concurrents
+                    # Colonnes de données seulement (ni id ni défauts ni contraintes):
+                    # aucune valeur de cities_id_seq consommée par le staging
+                    await driver.execute(
+                        "CREATE TEMP TABLE IF NOT EXISTS cities_stage ON COMMIT DELETE ROWS AS "
+                        f"SELECT {stage_columns} FROM cities WITH NO DATA"
+                    )
+                    await driver.copy_records_to_table('cities_stage', records=records, columns=names)
+                    rows = await driver.fetch(merge_sql)
+
+            for row in rows:
+                if row['inserted']:
+                    stats['inserted'] += 1
+                else:
+                    stats['updated'] += 1
+
+        except Exception as e:
+            # Batch entier perdu: compté dans stats['errors'], à remonter par l'appelant
+            logger.exception(f"Erreur COPY cities ({count} villes): {e}")
+            stats['errors'] += count
 
         return stats
 
+    async def _upsert_rows(self, session, model, rows: List[Dict[str, Any]], stats: Dict[str, int]):
+        """UPSERT multi-lignes: une seule requête par groupe de colonnes homogènes."""
+        # L'enrichissement ne renseigne pas toujours les mêmes clés: on regroupe
+        # les lignes par jeu de colonnes pour ne mettre à jour que celles fournies
+        groups = defaultdict(list)
+        for row in rows:
+            groups[tuple(sorted(row))].append(row)
+
+        connection = await session.connection()
+        for columns, group in groups.items():
+            # Instruction identique d'un batch à l'autre: exécutée en executemany
+            # (stratégie insertmanyvalues) et réutilisée depuis le cache de compilation
+            result = await connection.execute(self._upsert_statement(model, columns), group)
+
+            for (inserted,) in result:
+                if inserted:
+                    stats['inserted'] += 1
+                else:
+                    stats['updated'] += 1
+
+    def _upsert_statement(self, model, columns: tuple):
+        """Construit (une seule fois) l'UPSERT d'un modèle pour un jeu de colonnes."""
+        key = (model, columns)
+        stmt = self._upsert_statements.get(key)
+        if stmt is None:
+            stmt = insert(model)
+
+            # ON CONFLICT DO UPDATE
+            update_dict = {k: stmt.excluded[k] for k in columns
+                           if k not in ('id', 'osm_id', 'created_at')}
+            update_dict['updated_at'] = stmt.excluded.updated_at
+
+            # xmax = 0 sur la ligne retournée <=> ligne insérée (et non mise à jour)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=['osm_id'],
+                set_=update_dict
+            ).returning(literal_column('xmax = 0').label('inserted'))
+            self._upsert_statements[key] = stmt
+        return stmt
+
     async def load_country_geometries(self):
-        """Charge les géométries des pays en mémoire pour les calculs."""
+        """Charge les géométries des pays en mémoire pour les calculs.
+
+        Chaque étape porte sur tous les pays à la fois: lecture du GeoJSON,
+        réparation et préparation par des appels GEOS vectorisés, classement
+        des cellules de la grille en threads.
+        """
         from ..models import Country
 
         logger.info("Chargement des géométries des pays...")
         
         async with self.db_manager.get_session() as session:
+            # GeoJSON lu en texte: décodé par GEOS plutôt qu'en dict Python puis shape()
             result = await session.execute(
-                select(Country.id, Country.country_code_alpha2, Country.boundaries, Country.name_local)
+                select(Country.id, Country.country_code_alpha2, Country.boundaries.cast(Text),
+                       Country.name_local)
                 .where(Country.boundaries.isnot(None))
             )
             
             countries = result.fetchall()
             
-            for country_id, code, boundaries_json, name in countries:
-                try:
-                    if boundaries_json:
-                        geom_data = json.loads(boundaries_json)
-                        
-                        # Créer la géométrie Shapely
-                        if geom_data.get('type') == 'Polygon':
-                            coords = geom_data.get('coordinates', [])
-                            if coords and coords[0]:  # Vérifier que ce n'est pas vide
-                                geom = Polygon(coords[0])
-                                self.country_geometries[country_id] = {
-                                    'geometry': geom,
-                                    'code': code,
-                                    'name': name
-                                }
-                        
-                except Exception as e:
-                    logger.warning(f"Erreur géométrie pays {name} ({code}): {e}")
-                    continue
+            # Tous les GeoJSON en un seul appel (None si illisible)
+            geometries = shapely.from_geojson(
+                np.array([geom_data for _, _, geom_data, _ in countries], dtype=object),
+                on_invalid='ignore'
+            )
+            # Frontières vides (import rapide) écartées
+            loaded = ~shapely.is_missing(geometries) & ~shapely.is_empty(geometries)
+            
+            for (country_id, code, _, name), geom, ok in zip(countries, geometries.tolist(), loaded.tolist()):
+                if ok:
+                    self.country_geometries[country_id] = {
+                        'geometry': geom,
+                        'code': code,
+                        'name': name
+                    }
+                elif geom is None:
+                    logger.warning(f"Erreur géométrie pays {name} ({code}): GeoJSON illisible")
             
+            # Réparation des géométries invalides: un seul appel GEOS vectorisé
+            self._strtree_ids = [country_id for (country_id, *_), ok in zip(countries, loaded.tolist()) if ok]
+            geometries = geometries[loaded]
+            invalid = ~shapely.is_valid(geometries)
+            if invalid.any():
+                geometries[invalid] = shapely.buffer(geometries[invalid], 0)
+                for tree_idx in np.flatnonzero(invalid).tolist():
+                    self.country_geometries[self._strtree_ids[tree_idx]]['geometry'] = geometries[tree_idx]
+
+            # Index spatial STRtree sur les géométries préparées
+            shapely.prepare(geometries)
+            self._strtree = STRtree(geometries)
+            self._build_country_grid(geometries)
+
             logger.info(f"Géométries chargées pour {len(self.country_geometries)} pays")
 
+    def _build_country_grid(self, geometries):
+        """Grille lat/lng: cellule entièrement contenue dans un seul pays -> position dans le STRtree.
+
+        Les cellules frontalières (ou revendiquées par plusieurs pays) valent -1
+        et sont résolues par le STRtree.
+        """
+        rows, cols = int(180 / GRID_RESOLUTION), int(360 / GRID_RESOLUTION)
+        grid = np.full(rows * cols, -1, dtype=np.int32)
+        claims = np.zeros(rows * cols, dtype=np.int8)
+
+        # Pays indépendants et GEOS libère le GIL: classement des cellules en threads
+        with ThreadPoolExecutor(max_workers=os.cpu_count()) as executor:
+            inner_cells = executor.map(lambda geom: self._inner_grid_cells(geom, rows, cols), geometries)
+
+            for tree_idx, cell_ids in enumerate(inner_cells):
+                grid[cell_ids] = tree_idx
+                claims[cell_ids] += 1
+
+        grid[claims > 1] = -1
+        self._grid = grid
+        logger.debug(f"Grille pays: {int((grid >= 0).sum())} cellules résolues")
+
+    @staticmethod
+    def _inner_grid_cells(geom, rows: int, cols: int) -> np.ndarray:
+        """Indices des cellules de la grille entièrement contenues dans une géométrie."""
+        min_lng, min_lat, max_lng, max_lat = geom.bounds
+        col, row = np.meshgrid(
+            np.arange(int((min_lng + 180) // GRID_RESOLUTION), min(int(np.ceil((max_lng + 180) / GRID_RESOLUTION)), cols)),
+            np.arange(int((min_lat + 90) // GRID_RESOLUTION), min(int(np.ceil((max_lat + 90) / GRID_RESOLUTION)), rows))
+        )
+        col, row = col.ravel(), row.ravel()
+        cells = shapely.box(col * GRID_RESOLUTION - 180, row * GRID_RESOLUTION - 90,
+                            (col + 1) * GRID_RESOLUTION - 180, (row + 1) * GRID_RESOLUTION - 90)
+        inside = shapely.contains(geom, cells)
+        return row[inside] * cols + col[inside]
+
+    def _grid_lookup(self, lats: np.ndarray, lngs: np.ndarray) -> np.ndarray:
+        """Position dans le STRtree du pays de chaque point via la grille (-1 si ambigu)."""
+        rows, cols = int(180 / GRID_RESOLUTION), int(360 / GRID_RESOLUTION)
+        row = np.clip(((lats + 90) // GRID_RESOLUTION).astype(np.int64), 0, rows - 1)
+        col = np.clip(((lngs + 180) // GRID_RESOLUTION).astype(np.int64), 0, cols - 1)
+        return self._grid[row * cols + col]
+
     def find_country_for_point(self, lat: float, lng: float) -> Optional[int]:
         """Trouve le pays contenant un point donné."""
         if not self.country_geometries:
             return None
             
+        # Cellule de grille entièrement dans un pays: pas de test géométrique
+        tree_idx = int(self._grid_lookup(np.array([lat]), np.array([lng]))[0])
+        if tree_idx >= 0:
+            return self._strtree_ids[tree_idx]
+
         point = Point(lng, lat)  # Shapely utilise (lng, lat)
         
-        # Recherche dans toutes les géométries
-        for country_id, country_data in self.country_geometries.items():
-            try:
-                if country_data['geometry'].contains(point):
-                    return country_id
-            except Exception as e:
-                logger.debug(f"Erreur test point dans {country_data['name']}: {e}")
-                continue
-                
+        # Pré-filtrage par bbox dans le R-tree puis test point-dans-polygone
+        # sur les seuls candidats (géométries préparées)
+        try:
+            for tree_idx in self._strtree.query(point).tolist():
+                if self._strtree.geometries[tree_idx].contains(point):
+                    return self._strtree_ids[tree_idx]
+        except Exception as e:
+            logger.debug(f"Erreur test point ({lat}, {lng}): {e}")
+
         return None
 
     async def link_cities_to_countries(self):
-        """Liaison précise villes-pays avec calculs géométriques."""
-        from ..models import City, Country
-
-        # 1. Charger les géométries
-        await self.load_country_geometries()
-        
-        if not self.country_geometries:
-            logger.warning("Aucune géométrie de pays disponible, utilisation de la méthode approximative")
-            await self.link_cities_to_countries_fallback()
-            return
+        """Liaison précise villes-pays avec calculs géométriques.
 
-        # 2. Liaison directe par code pays dans les tags
-        await self._link_by_country_tags()
+        Toutes les étapes partagent une session et sont validées par un seul commit.
+        """
+        postgis = await self._postgis_available()
+        if not postgis:
+            # 1. Charger les géométries
+            await self.load_country_geometries()
 
-        # 3. Liaison géométrique précise
-        await self._link_by_geometry()
+        async with self.db_manager.get_session() as session:
+            if postgis:
+                # 2-3. Tags puis jointure spatiale entièrement en base
+                await self._link_by_country_tags(session)
+                has_geometries = await self._link_by_postgis(session) > 0
+            elif self.country_geometries:
+                # 2. Liaison directe par code pays dans les tags
+                await self._link_by_country_tags(session)
+
+                # 3. Liaison géométrique précise
+                await self._link_by_geometry(session)
+                has_geometries = True
+            else:
+                has_geometries = False
+
+            if not has_geometries:
+                logger.warning("Aucune géométrie de pays disponible, utilisation de la méthode approximative")
+                await self._link_fallback(session)
+            else:
+                # 4. Liaison approximative pour les cas non résolus
+                await self._link_by_proximity(session)
+            await session.commit()
 
-        # 4. Liaison approximative pour les cas non résolus
-        await self._link_by_proximity()
+        # Statistiques du planificateur rafraîchies après la mise à jour massive de country_id
+        await self._analyze_cities()
 
         # 5. Statistiques
         stats = await self.get_linking_stats()
         logger.info(f"Liaison précise terminée - {stats['linked_cities']}/{stats['total_cities']} "
                    f"villes liées ({stats['link_percentage']:.1f}%)")
 
-    async def _link_by_country_tags(self):
+    async def _analyze_cities(self):
+        """ANALYZE cities sur une connexion en autocommit (statistiques persistées)."""
+        try:
+            async with self.db_manager.engine.connect() as conn:
+                conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+                await conn.execute(text("ANALYZE cities"))
+        except Exception as e:
+            logger.warning(f"Erreur ANALYZE cities: {e}")
+
+    async def _postgis_available(self) -> bool:
+        """Vérifie (une seule fois) si l'extension PostGIS est installée dans la base."""
+        if self._postgis is None:
+            async with self.db_manager.get_session() as session:
+                result = await session.execute(
+                    text("SELECT 1 FROM pg_extension WHERE extname = 'postgis'")
+                )
+                self._postgis = result.first() is not None
+        return self._postgis
+
+    async def _link_by_postgis(self, session) -> int:
+        """Liaison par jointure spatiale ST_Contains (PostGIS + index GiST).
+
+        Retourne le nombre de pays disposant d'une géométrie.
+        """
+        # boundary_geom est renseignée à l'import; rattrapage des pays importés avant
+        await session.execute(text(
+            "ALTER TABLE countries ADD COLUMN IF NOT EXISTS boundary_geom geometry(MultiPolygon, 4326)"
+        ))
+        await session.execute(text(f"""
+        UPDATE countries
+        SET boundary_geom = {BOUNDARY_GEOM_SQL}
+        WHERE boundary_geom IS NULL
+        AND {HAS_BOUNDARY_SQL}
+        """))
+        await session.execute(text(
+            "CREATE INDEX IF NOT EXISTS idx_countries_boundary_geom ON countries USING GIST(boundary_geom)"
+        ))
+
+        geometries = (await session.execute(text(
+            "SELECT count(*) FROM countries WHERE boundary_geom IS NOT NULL"
+        ))).scalar()
+
+        if not geometries:
+            return 0
+
+        # Une seule requête ensembliste au lieu d'un UPDATE par ville
+        result = await session.execute(text("""
+        UPDATE cities
+        SET country_id = c.id
+        FROM countries c
+        WHERE cities.country_id IS NULL
+        AND cities.center_lat IS NOT NULL
+        AND cities.center_lng IS NOT NULL
+        AND ST_Contains(
+            c.boundary_geom,
+            ST_SetSRID(ST_MakePoint(cities.center_lng::float8, cities.center_lat::float8), 4326)
+        )
+        """))
+        logger.info(f"Liaison spatiale PostGIS: {result.rowcount} villes")
+
+        return geometries
+
+    async def _link_by_country_tags(self, session):
         """Liaison directe par codes pays dans les tags OSM."""
-        async with self.db_manager.get_session() as session:
-            stmt = text("""
-            UPDATE cities 
-            SET country_id = (
-                SELECT c.id 
-                FROM countries c 
-                WHERE c.country_code_alpha2 = cities.country_code_from_tags
-                LIMIT 1
-            )
-            WHERE cities.country_id IS NULL 
-            AND cities.country_code_from_tags IS NOT NULL
-            """)
-            
-            result = await session.execute(stmt)
-            await session.commit()
-            logger.info(f"Liaison par tags: {result.rowcount} villes")
+        # Jointure (hash join) plutôt qu'une sous-requête corrélée par ville;
+        # country_code_alpha2 est unique, une ville ne matche qu'un pays
+        stmt = text("""
+        UPDATE cities 
+        SET country_id = c.id
+        FROM countries c
+        WHERE c.country_code_alpha2 = cities.country_code_from_tags
+        AND cities.country_id IS NULL 
+        AND cities.country_code_from_tags IS NOT NULL
+        """)
+        
+        result = await session.execute(stmt)
+        logger.info(f"Liaison par tags: {result.rowcount} villes")
 
-    async def _link_by_geometry(self):
+    async def _link_by_geometry(self, session):
         """Liaison par calculs géométriques précis."""
         from ..models import City
 
-        async with self.db_manager.get_session() as session:
-            # Récupérer les villes non liées par petits lots
-            batch_size = 1000
-            offset = 0
-            total_linked = 0
+        # Récupérer les villes non liées par lots (pagination par id: les
+        # villes liées sortent du filtre, un OFFSET en sauterait)
+        batch_size = 10000
+        last_id = 0
+        total_linked = 0
 
-            while True:
-                result = await session.execute(
-                    select(City.id, City.center_lat, City.center_lng)
-                    .where(and_(
-                        City.country_id.is_(None),
-                        City.center_lat.isnot(None),
-                        City.center_lng.isnot(None)
-                    ))
-                    .limit(batch_size)
-                    .offset(offset)
-                )
-                
-                cities = result.fetchall()
-                if not cities:
-                    break
-
-                # Traiter le lot
-                updates = []
-                for city_id, lat, lng in cities:
-                    try:
-                        country_id = self.find_country_for_point(float(lat), float(lng))
-                        if country_id:
-                            updates.append({'city_id': city_id, 'country_id': country_id})
-                    except Exception as e:
-                        logger.debug(f"Erreur géométrie ville {city_id}: {e}")
-                        continue
-
-                # Appliquer les mises à jour
-                if updates:
-                    for update_data in updates:
-                        await session.execute(
-                            update(City)
-                            .where(City.id == update_data['city_id'])
-                            .values(country_id=update_data['country_id'])
-                        )
-                    
-                    await session.commit()
-                    total_linked += len(updates)
-                    logger.debug(f"Lot géométrique: {len(updates)}/{len(cities)} villes liées")
-
-                offset += batch_size
-
-            logger.info(f"Liaison géométrique: {total_linked} villes")
-
-    async def _link_by_proximity(self):
-        """Liaison par proximité pour les cas non résolus."""
-        async with self.db_manager.get_session() as session:
-            stmt = text("""
-            UPDATE cities
-            SET country_id = (
-                SELECT c.id
-                FROM countries c
-                WHERE c.center_lat IS NOT NULL 
-                AND c.center_lng IS NOT NULL
-                ORDER BY 
-                    SQRT(POWER(cities.center_lat - c.center_lat, 2) + 
-                         POWER(cities.center_lng - c.center_lng, 2))
-                LIMIT 1
+        while True:
+            result = await session.execute(
+                select(City.id, City.center_lat, City.center_lng)
+                .where(and_(
+                    City.id > last_id,
+                    City.country_id.is_(None),
+                    City.center_lat.isnot(None),
+                    City.center_lng.isnot(None)
+                ))
+                .order_by(City.id)
+                .limit(batch_size)
             )
-            WHERE cities.country_id IS NULL
-            AND cities.center_lat IS NOT NULL
-            AND cities.center_lng IS NOT NULL
-            """)
             
-            result = await session.execute(stmt)
-            await session.commit()
-            logger.info(f"Liaison par proximité: {result.rowcount} villes")
+            cities = result.fetchall()
+            if not cities:
+                break
+            last_id = cities[-1][0]
+
+            # Traiter le lot: grille pour les cellules intérieures, puis
+            # point-dans-polygone vectorisé (STRtree + GEOS en C) pour le reste
+            city_ids, lats, lngs = zip(*cities)
+            lats = np.asarray(lats, dtype=float)
+            lngs = np.asarray(lngs, dtype=float)
+            hits = self._grid_lookup(lats, lngs)
+
+            pending = np.flatnonzero(hits < 0)
+            points = shapely.points(lngs[pending], lats[pending])
+
+            # Candidats par bbox, puis contains() sur la géométrie du pays préparée:
+            # query(predicate='within') préparerait les points et non les polygones
+            point_idx, tree_idx = self._strtree.query(points)
+            inside = shapely.contains(self._strtree.geometries[tree_idx], points[point_idx])
+            point_idx, tree_idx = point_idx[inside], tree_idx[inside]
+
+            # Un point sur une frontière commune: on garde le premier pays trouvé
+            point_idx, first = np.unique(point_idx, return_index=True)
+            hits[pending[point_idx]] = tree_idx[first]
+
+            linked = np.flatnonzero(hits >= 0)
+            linked_ids = [city_ids[i] for i in linked.tolist()]
+            country_ids = [self._strtree_ids[t] for t in hits[linked].tolist()]
+
+            # Appliquer les mises à jour: un seul UPDATE ... FROM UNNEST par lot
+            if linked_ids:
+                await session.execute(
+                    text("""
+                    UPDATE cities SET country_id = data.cid
+                    FROM (SELECT UNNEST(CAST(:ids AS integer[])) AS id,
+                                 UNNEST(CAST(:cids AS integer[])) AS cid) AS data
+                    WHERE cities.id = data.id
+                    """),
+                    {'ids': linked_ids, 'cids': country_ids}
+                )
+
+                total_linked += len(linked_ids)
+                logger.debug(f"Lot géométrique: {len(linked_ids)}/{len(cities)} villes liées")
+
+        logger.info(f"Liaison géométrique: {total_linked} villes")
+
+    async def _link_by_proximity(self, session):
+        """Liaison par proximité pour les cas non résolus."""
+        if await self._postgis_available():
+            await self._link_by_proximity_knn(session)
+            return
+
+        # Distance au carré: même ordre que la distance euclidienne, sans SQRT/POWER
+        stmt = text("""
+        UPDATE cities
+        SET country_id = (
+            SELECT c.id
+            FROM countries c
+            WHERE c.center_lat IS NOT NULL 
+            AND c.center_lng IS NOT NULL
+            ORDER BY 
+                (cities.center_lat - c.center_lat) * (cities.center_lat - c.center_lat) +
+                (cities.center_lng - c.center_lng) * (cities.center_lng - c.center_lng)
+            LIMIT 1
+        )
+        WHERE cities.country_id IS NULL
+        AND cities.center_lat IS NOT NULL
+        AND cities.center_lng IS NOT NULL
+        """)
+        
+        result = await session.execute(stmt)
+        logger.info(f"Liaison par proximité: {result.rowcount} villes")
+
+    async def _link_by_proximity_knn(self, session):
+        """Liaison par proximité via l'opérateur KNN <-> de PostGIS (index GiST)."""
+        await session.execute(text(
+            "ALTER TABLE countries ADD COLUMN IF NOT EXISTS center_geom geometry(Point, 4326)"
+        ))
+        await session.execute(text("""
+        UPDATE countries
+        SET center_geom = ST_SetSRID(ST_MakePoint(center_lng::float8, center_lat::float8), 4326)
+        WHERE center_lat IS NOT NULL AND center_lng IS NOT NULL
+        """))
+        await session.execute(text(
+            "CREATE INDEX IF NOT EXISTS idx_countries_center_geom ON countries USING GIST(center_geom)"
+        ))
+
+        # Plus proche centre de pays par parcours d'index, sans calcul sur tous les pays
+        result = await session.execute(text("""
+        UPDATE cities
+        SET country_id = (
+            SELECT c.id
+            FROM countries c
+            WHERE c.center_geom IS NOT NULL
+            ORDER BY c.center_geom <-> ST_SetSRID(
+                ST_MakePoint(cities.center_lng::float8, cities.center_lat::float8), 4326)
+            LIMIT 1
+        )
+        WHERE cities.country_id IS NULL
+        AND cities.center_lat IS NOT NULL
+        AND cities.center_lng IS NOT NULL
+        """))
+        logger.info(f"Liaison par proximité (KNN): {result.rowcount} villes")
 
     async def link_cities_to_countries_fallback(self):
         """Méthode de fallback si pas de géométries disponibles."""
+        async with self.db_manager.get_session() as session:
+            await self._link_fallback(session)
+            await session.commit()
+
+    async def _link_fallback(self, session):
+        """Étapes de la liaison approximative, dans la session fournie."""
         logger.info("Utilisation de la méthode de liaison approximative")
         
         # Liaison par tags
-        await self._link_by_country_tags()
+        await self._link_by_country_tags(session)
         
         # Liaison approximative par régions (version simplifiée)
-        await self._link_by_simple_regions()
+        await self._link_by_simple_regions(session)
         
         # Liaison par proximité
-        await self._link_by_proximity()
+        await self._link_by_proximity(session)
 
-    async def _link_by_simple_regions(self):
+    async def _link_by_simple_regions(self, session):
         """Liaison approximative par grandes régions géographiques."""
-        async with self.db_manager.get_session() as session:
+        
+        # Quelques règles simples et sûres
+        simple_rules = [
+            # Antarctique
+            ("'AQ'", "cities.center_lat < -60"),
             
-            # Quelques règles simples et sûres
-            simple_rules = [
-                # Antarctique
-                ("'AQ'", "cities.center_lat < -60"),
-                
-                # Groenland
-                ("'GL'", "cities.center_lat > 70 AND cities.center_lng BETWEEN -50 AND -10"),
-                
-                # Islande
-                ("'IS'", "cities.center_lat BETWEEN 63 AND 67 AND cities.center_lng BETWEEN -25 AND -13"),
-                
-                # Australie (continent principal)
-                ("'AU'", "cities.center_lat BETWEEN -45 AND -10 AND cities.center_lng BETWEEN 110 AND 155"),
-                
-                # Nouvelle-Zélande
-                ("'NZ'", "cities.center_lat BETWEEN -48 AND -34 AND cities.center_lng BETWEEN 165 AND 180"),
-            ]
-
-            total_linked = 0
-            for country_code, condition in simple_rules:
-                stmt = text(f"""
-                UPDATE cities
-                SET country_id = (
-                    SELECT c.id
-                    FROM countries c
-                    WHERE c.country_code_alpha2 = {country_code}
-                    LIMIT 1
-                )
-                WHERE cities.country_id IS NULL
-                AND {condition}
-                """)
-                
-                result = await session.execute(stmt)
-                await session.commit()
-                total_linked += result.rowcount
-                
-            logger.info(f"Liaison par régions simples: {total_linked} villes")
+            # Groenland
+            ("'GL'", "cities.center_lat > 70 AND cities.center_lng BETWEEN -50 AND -10"),
+            
+            # Islande
+            ("'IS'", "cities.center_lat BETWEEN 63 AND 67 AND cities.center_lng BETWEEN -25 AND -13"),
+            
+            # Australie (continent principal)
+            ("'AU'", "cities.center_lat BETWEEN -45 AND -10 AND cities.center_lng BETWEEN 110 AND 155"),
+            
+            # Nouvelle-Zélande
+            ("'NZ'", "cities.center_lat BETWEEN -48 AND -34 AND cities.center_lng BETWEEN 165 AND 180"),
+        ]
+
+        # Toutes les règles (disjointes) en un seul parcours de cities
+        cases = "\n".join(
+            f"WHEN {condition} THEN {country_code}" for country_code, condition in simple_rules
+        )
+        stmt = text(f"""
+        WITH candidates AS (
+            SELECT cities.id, CASE {cases} END AS code
+            FROM cities
+            WHERE cities.country_id IS NULL
+        )
+        UPDATE cities
+        SET country_id = c.id
+        FROM candidates cd
+        JOIN countries c ON c.country_code_alpha2 = cd.code
+        WHERE cities.id = cd.id
+        """)
+
+        result = await session.execute(stmt)
+        total_linked = result.rowcount
+
+        logger.info(f"Liaison par régions simples: {total_linked} villes")
 
     async def get_linking_stats(self) -> Dict[str, Any]:
         """Retourne les statistiques de liaison."""
-        from ..models import City
-
         async with self.db_manager.get_session() as session:
-            total_result = await session.execute(select(func.count(City.id)))
-            total_cities = total_result.scalar() or 0
-
-            linked_result = await session.execute(
-                select(func.count(City.id)).where(City.country_id.isnot(None))
-            )
-            linked_cities = linked_result.scalar() or 0
+            total_cities, linked_cities = await self._count_cities(session)
 
             unlinked_cities = total_cities - linked_cities
             link_percentage = (linked_cities / total_cities * 100) if total_cities > 0 else 0
@@ -358,23 +629,23 @@ class DatabaseOperations:
             }
 
     async def get_import_stats(self) -> Dict[str, int]:
-        """Retourne les statistiques d'import."""
-        from ..models import City, Country
-
+        """Retourne les statistiques d'import (une seule requête, un seul parcours de cities)."""
         async with self.db_manager.get_session() as session:
-            country_result = await session.execute(select(func.count(Country.id)))
-            country_count = country_result.scalar()
-
-            city_result = await session.execute(select(func.count(City.id)))
-            city_count = city_result.scalar()
-
-            linked_result = await session.execute(
-                select(func.count(City.id)).where(City.country_id.isnot(None))
-            )
-            linked_cities = linked_result.scalar()
+            row = (await session.execute(text("""
+            SELECT (SELECT count(*) FROM countries) AS countries,
+                   count(*) AS cities, count(country_id) AS linked_cities
+            FROM cities
+            """))).one()
 
             return {
-                'countries': country_count or 0,
-                'cities': city_count or 0,
-                'linked_cities': linked_cities or 0
-            }
\ No newline at end of file
+                'countries': row.countries or 0,
+                'cities': row.cities,
+                'linked_cities': row.linked_cities
+            }
+
+    async def _count_cities(self, session) -> Tuple[int, int]:
+        """Compte exactement (total, liées) pour la table cities, en un seul parcours."""
+        row = (await session.execute(text("""
+        SELECT count(*) AS total, count(country_id) AS linked FROM cities
+        """))).one()
+        return row.total, row.linked
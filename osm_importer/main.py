@@ -2,14 +2,14 @@ import asyncio
 import click
 from pathlib import Path
 import logging
-from typing import Optional
+from typing import Optional, List, Dict, Any
 import time
 
 from .config import Config
 from .database.connection import DatabaseManager
 from .database.operations import DatabaseOperations
-from .parsers.country_parser import CountryParser
-from .parsers.city_parser import CityParser
+from .parsers.country_parser import CountryParserSimplified as CountryParser
+from .parsers.city_parser import CityParser, CityColumns
 from .processors.data_enricher import DataEnricher
 from .utils.logger import setup_logger
 from .utils.progress import ProgressTracker
@@ -42,18 +42,15 @@ class OSMImporter:
         self.logger.info(f"Début import: {file_name}")
 
         with ProgressTracker() as progress:
-            # Phase 1: Parse et extraction (en une seule passe)
-            self.logger.info("Phase 1: Extraction des données OSM")
-            countries_data, cities_data = await self._extract_osm_data_optimized(osm_file, progress)
+            # Phases 1-3 en pipeline: les villes sont enrichies et importées par
+            # batch pendant que le parsing du fichier se poursuit
+            self.logger.info("Phases 1-3: Extraction, enrichissement et import des villes")
+            countries_data, city_stats = await self._extract_osm_data_optimized(osm_file, progress)
 
-            # Phase 2: Enrichissement
-            self.logger.info("Phase 2: Enrichissement des données")
+            # Pays (quelques centaines): enrichis et importés une fois le parsing terminé
+            self.logger.info("Enrichissement et import des pays")
             enriched_countries = await self._enrich_countries(countries_data, progress)
-            enriched_cities = await self._enrich_cities(cities_data, progress)
-
-            # Phase 3: Import en base
-            self.logger.info("Phase 3: Import en base de données")
-            await self._import_to_database(enriched_countries, enriched_cities, progress)
+            await self._import_to_database(enriched_countries, progress)
 
             # Phase 4: Liaison des données
             self.logger.info("Phase 4: Liaison villes-pays")
@@ -68,9 +65,22 @@ class OSMImporter:
 
         self.logger.info(f"Import terminé en {elapsed:.1f}s")
         self.logger.info(f"Statistiques: {stats['countries']} pays, {stats['cities']} villes")
+        self.logger.info(
+            f"Villes: {city_stats['inserted']} insérées, {city_stats['updated']} mises à jour"
+        )
+
+        # Batchs de villes perdus: l'import est incomplet, le run échoue
+        if city_stats['errors']:
+            self.logger.error(f"{city_stats['errors']} villes non importées (voir les erreurs ci-dessus)")
+            raise RuntimeError(f"Import incomplet: {city_stats['errors']} villes non importées")
 
     async def _extract_osm_data_optimized(self, osm_file: Path, progress):
-        """Extrait les données depuis le fichier OSM en une seule passe."""
+        """Extrait les données depuis le fichier OSM en une seule passe.
+
+        Les villes sont transmises par batch à des workers (enrichissement puis
+        upsert) au fil du parsing. Retourne les pays extraits et les stats
+        d'import des villes cumulées sur tous les workers.
+        """
         import osmium
 
         self.logger.info("Extraction en une passe (sans pré-comptage)...")
@@ -83,66 +93,153 @@ class OSMImporter:
         # Initialiser les barres de progression avec estimations
         country_task = progress.add_task("countries", f"Pays ({osm_file.name})", estimated_countries)
         city_task = progress.add_task("cities", f"Villes ({osm_file.name})", estimated_cities)
+        progress.add_task("enrich_cities", "Enrichissement villes", estimated_cities)
+        progress.add_task("import_cities", "Import villes", estimated_cities)
 
         # Parseurs avec progression
         country_parser = CountryParser(progress)
         city_parser = CityParser(progress)
 
+        # File bornée entre le thread de parsing et les workers: le parsing se
+        # met en pause si l'enrichissement/l'import prennent du retard
+        batch_size = self.config.import_.batch_size
+        num_workers = self.config.import_.num_workers
+        loop = asyncio.get_running_loop()
+        city_batches = asyncio.Queue(maxsize=num_workers * 4)
+        city_stats = {'inserted': 0, 'updated': 0, 'errors': 0}
+
         # Parser combiné pour une seule passe
         class CombinedParser(osmium.SimpleHandler):
-            def __init__(self, country_parser, city_parser, progress_tracker):
+            def __init__(self, country_parser, city_parser):
                 osmium.SimpleHandler.__init__(self)
                 self.country_parser = country_parser
                 self.city_parser = city_parser
-                self.progress = progress_tracker
-                self.processed_elements = 0
+                self.cities_found = 0
+                # Chemin chaud: méthode liée une fois, seuil comparé à un simple
+                # compteur entier plutôt qu'un appel à len() par node
+                self._city_node = city_parser.node
+                self._next_flush = batch_size
 
             def relation(self, r):
                 self.country_parser.relation(r)
-                self._update_progress()
 
             def node(self, n):
-                self.city_parser.node(n)
-                self._update_progress()
-
-            def _update_progress(self):
-                self.processed_elements += 1
-                # Mettre à jour les estimations tous les 10000 éléments
-                if self.processed_elements % 10000 == 0:
-                    countries_found = len(self.country_parser.countries)
-                    cities_found = len(self.city_parser.cities)
-
-                    # Ajuster les totaux si nécessaire
-                    if countries_found > estimated_countries * 0.8:
-                        self.progress.update_total("countries", int(countries_found * 1.2))
-                    if cities_found > estimated_cities * 0.8:
-                        self.progress.update_total("cities", int(cities_found * 1.2))
-
-        # Exécuter le parsing combiné
-        combined_parser = CombinedParser(country_parser, city_parser, progress)
-        await self._run_parser(osm_file, combined_parser)
+                self._city_node(n)
+                if self.city_parser.processed_count >= self._next_flush:
+                    self.flush_cities()
+
+            def flush_cities(self):
+                """Transmet le batch de villes courant aux workers (depuis le thread de parsing)."""
+                batch = self.city_parser.cities
+                self.city_parser.cities = CityColumns()
+                self.cities_found += len(batch)
+                self._next_flush += batch_size
+                asyncio.run_coroutine_threadsafe(city_batches.put(batch), loop).result()
+
+        combined_parser = CombinedParser(country_parser, city_parser)
+
+        async def watch_progress():
+            """Ajuste les totaux estimés toutes les 500 ms, hors de la boucle de parsing."""
+            while True:
+                await asyncio.sleep(0.5)
+                countries_found = len(country_parser.countries)
+                cities_found = combined_parser.cities_found + len(city_parser.cities)
+
+                # Ajuster les totaux si nécessaire
+                if countries_found > estimated_countries * 0.8:
+                    progress.update_total("countries", int(countries_found * 1.2))
+                if cities_found > estimated_cities * 0.8:
+                    for task in ("cities", "enrich_cities", "import_cities"):
+                        progress.update_total(task, int(cities_found * 1.2))
+
+        # Exécuter le parsing combiné (thread dédié) pendant que la boucle suit
+        # la progression et que les workers traitent les batchs de villes
+        workers = [asyncio.create_task(self._city_worker(city_batches, city_stats, progress))
+                   for _ in range(num_workers)]
+        watcher = asyncio.create_task(watch_progress())
+        try:
+            await self._run_parser(osm_file, combined_parser, self._osm_tag_filters())
+            city_parser.finalize()
+
+            # Dernier batch incomplet
+            remaining = city_parser.cities
+            if len(remaining):
+                combined_parser.cities_found += len(remaining)
+                await city_batches.put(remaining)
+        finally:
+            watcher.cancel()
+            for _ in workers:
+                await city_batches.put(None)
+
+        await asyncio.gather(*workers)
 
         # Finaliser les barres de progression avec les vraies valeurs
         actual_countries = len(country_parser.countries)
-        actual_cities = len(city_parser.cities)
+        actual_cities = combined_parser.cities_found
 
         progress.update_total("countries", actual_countries)
-        progress.update_total("cities", actual_cities)
         progress.update("countries", completed=actual_countries)
+        for task in ("cities", "enrich_cities", "import_cities"):
+            progress.update_total(task, actual_cities)
         progress.update("cities", completed=actual_cities)
 
         self.logger.info(f"Extraction terminée: {actual_countries} pays, {actual_cities} villes")
 
-        return country_parser.countries, city_parser.cities
+        return country_parser.countries, city_stats
+
+    async def _city_worker(self, city_batches: asyncio.Queue, city_stats: Dict[str, int], progress):
+        """Consomme les batchs de villes du parser: enrichissement puis upsert.
+
+        Les stats de chaque batch sont cumulées dans `city_stats` (partagé entre
+        les workers); un batch en échec y est compté en erreurs.
+        """
+        loop = asyncio.get_running_loop()
+
+        while True:
+            batch = await city_batches.get()
+            if batch is None:
+                return
+
+            try:
+                # Enrichissement (CPU) hors de la boucle pour ne pas bloquer les I/O
+                columns = await loop.run_in_executor(None, self._enrich_city_batch, batch)
+                progress.update("enrich_cities", advance=len(batch))
+
+                # Colonnes copiées directement (COPY), sans dict par ville
+                stats = await self.db_operations.copy_cities(columns)
+                progress.update("import_cities", advance=len(batch))
+                self.logger.debug(f"Batch villes: {stats}")
+            except Exception as e:
+                self.logger.exception(f"Erreur batch villes ({len(batch)} villes): {e}")
+                stats = {'errors': len(batch)}
+
+            for key, value in stats.items():
+                city_stats[key] += value
+
+    def _osm_tag_filters(self):
+        """Filtres osmium (C++) tirés de la config: seuls les éléments utiles remontent en Python.
+
+        Villes: nodes portant l'un des tags de osm.tags_cities.
+        Pays: relations portant tous les tags de osm.tags_countries.
+        """
+        import osmium
+
+        city_tags = [tuple(tag.split('=', 1)) for tag in self.config.osm.tags_cities]
+        filters = [osmium.filter.TagFilter(*city_tags).enable_for(osmium.osm.NODE)]
+        for tag in self.config.osm.tags_countries:
+            filters.append(
+                osmium.filter.TagFilter(tuple(tag.split('=', 1))).enable_for(osmium.osm.RELATION)
+            )
+        return filters
 
-    async def _run_parser(self, osm_file: Path, parser):
+    async def _run_parser(self, osm_file: Path, parser, filters=()):
         """Exécute un parser osmium de manière asynchrone avec progression."""
         loop = asyncio.get_event_loop()
 
         def parse_with_progress():
             # Afficher la progression du fichier
             self.logger.info(f"Traitement de {osm_file.name} ({osm_file.stat().st_size / (1024*1024):.1f} MB)")
-            parser.apply_file(str(osm_file))
+            parser.apply_file(str(osm_file), filters=list(filters))
 
         await loop.run_in_executor(None, parse_with_progress)
 
@@ -183,63 +280,48 @@ class OSMImporter:
 
         return enriched
 
-    async def _enrich_cities(self, cities_data, progress):
-        """Enrichit les données des villes."""
-        if not cities_data:
-            return []
-
-        progress.add_task("enrich_cities", "Enrichissement villes", len(cities_data))
-
-        enriched = []
-        for city in cities_data:
-            try:
-                # Conversion vers dictionnaire
-                city_dict = {
-                    'osm_id': city.osm_id,
-                    'name_fr': city.name_fr,
-                    'name_en': city.name_en,
-                    'name_local': city.name_local,
-                    'display_name': city.display_name,
-                    'center_lat': city.center_lat,
-                    'center_lng': city.center_lng,
-                    'region_state': city.region_state,
-                    'place_type': city.place_type
-                }
-
-                # Enrichissement
-                enrichment = self.data_enricher.enrich_city(city)
-                city_dict.update(enrichment)
+    def _enrich_city_batch(self, cities_data: CityColumns) -> Dict[str, List[Any]]:
+        """Enrichit un batch de villes (par colonnes); retourne les colonnes à importer."""
+        # Coordonnées entières osmium -> degrés, en une opération NumPy par colonne
+        columns = cities_data.select(fields=(
+            'osm_id', 'name_fr', 'name_en', 'name_local', 'display_name',
+            'center_lat', 'center_lng', 'region_state', 'place_type'
+        ))
+        # Enrichissement du batch en une passe vectorisée, par colonnes
+        try:
+            columns.update(self.data_enricher.enrich_cities_bulk(
+                columns['center_lat'], columns['center_lng']
+            ))
+        except Exception as e:
+            self.logger.error(f"Erreur enrichissement villes: {e}")
 
-                enriched.append(city_dict)
-                progress.update("enrich_cities")
+        return columns
 
-            except Exception as e:
-                self.logger.error(f"Erreur enrichissement ville {city.osm_id}: {e}")
-                continue
+    async def _import_to_database(self, countries, progress):
+        """Importe les pays enrichis en base (les villes le sont par les workers)."""
+        # Import des pays par batch
+        if countries:
+            progress.add_task("import_countries", "Import pays", len(countries))
+            await self._run_batches(self.db_operations.upsert_countries, countries,
+                                    "import_countries", "pays", progress)
 
-        return enriched
+    async def _run_batches(self, upsert, rows, task_id, label, progress):
+        """Exécute les batchs d'upsert en parallèle, au plus num_workers à la fois.
 
-    async def _import_to_database(self, countries, cities, progress):
-        """Importe les données enrichies en base."""
+        Chaque batch utilise sa propre session (donc sa propre connexion du pool).
+        """
         batch_size = self.config.import_.batch_size
+        semaphore = asyncio.Semaphore(self.config.import_.num_workers)
 
-        # Import des pays par batch
-        if countries:
-            progress.add_task("import_countries", "Import pays", len(countries))
-            for i in range(0, len(countries), batch_size):
-                batch = countries[i:i + batch_size]
-                stats = await self.db_operations.upsert_countries(batch)
-                progress.update("import_countries", advance=len(batch))
-                self.logger.debug(f"Batch pays: {stats}")
-
-        # Import des villes par batch
-        if cities:
-            progress.add_task("import_cities", "Import villes", len(cities))
-            for i in range(0, len(cities), batch_size):
-                batch = cities[i:i + batch_size]
-                stats = await self.db_operations.upsert_cities(batch)
-                progress.update("import_cities", advance=len(batch))
-                self.logger.debug(f"Batch villes: {stats}")
+        async def run(batch):
+            async with semaphore:
+                stats = await upsert(batch)
+            progress.update(task_id, advance=len(batch))
+            self.logger.debug(f"Batch {label}: {stats}")
+
+        await asyncio.gather(*(
+            run(rows[i:i + batch_size]) for i in range(0, len(rows), batch_size)
+        ))
 
     async def close(self):
         """Ferme l'importateur."""
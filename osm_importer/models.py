@@ -1,4 +1,6 @@
 from sqlalchemy import Column, Integer, BigInteger, String, Text, DateTime, DECIMAL, ARRAY, ForeignKey
+from sqlalchemy.types import TypeDecorator
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
@@ -6,6 +8,28 @@ from sqlalchemy.orm import relationship
 Base = declarative_base()
 
 
+class GeoJSON(TypeDecorator):
+    """JSONB acceptant un GeoJSON déjà sérialisé.
+
+    Les frontières arrivent des extracteurs en GeoJSON texte: une chaîne est
+    transmise telle quelle (PostgreSQL l'analyse directement), les autres
+    valeurs passent par la sérialisation JSON standard du moteur.
+    """
+
+    impl = JSONB
+    cache_ok = True
+
+    def bind_processor(self, dialect):
+        serialize = self.impl_instance.bind_processor(dialect)
+
+        def process(value):
+            if isinstance(value, str) or serialize is None:
+                return value
+            return serialize(value)
+
+        return process
+
+
 class Country(Base):
     __tablename__ = 'countries'
 
@@ -19,7 +43,7 @@ class Country(Base):
     country_code_alpha3 = Column(String(3), unique=True, index=True)
     center_lat = Column(DECIMAL(10, 8))
     center_lng = Column(DECIMAL(11, 8))
-    boundaries = Column(Text)  # GeoJSON
+    boundaries = Column(GeoJSON)  # GeoJSON
     continent = Column(String(50))
     region = Column(String(100))
     timezones = Column(ARRAY(Text))
@@ -1,24 +1,102 @@
 import osmium
-from typing import Dict, Optional, List
+import sys
+from array import array
+import numpy as np
+from typing import Any, Dict, Optional, List, Sequence, Tuple
 import logging
 
 logger = logging.getLogger(__name__)
 
-
-class CityData:
-    """Structure pour les données d'une ville."""
+# Nombre de villes entre deux mises à jour de la barre de progression
+PROGRESS_STEP = 1024
+
+# Précision des coordonnées entières d'osmium (x/y en 1e-7 degré)
+COORDINATE_PRECISION = 10_000_000
+
+# Types de lieux retenus comme villes (chaînes internées, partagées par toutes les lignes)
+VALID_PLACE_TYPES = frozenset(sys.intern(place) for place in ('city', 'town', 'village', 'hamlet'))
+
+# Tags candidats, par ordre de priorité
+REGION_TAGS = (
+    'addr:state',
+    'state',
+    'addr:province',
+    'province',
+    'addr:region',
+    'region',
+    'is_in:state',
+    'is_in:province',
+    'is_in:region'
+)
+
+COUNTRY_TAGS = (
+    'addr:country',
+    'country',
+    'addr:country_code',
+    'country_code',
+    'ISO3166-1:alpha2',
+    'is_in:country',
+    'is_in:country_code'
+)
+
+# Mêmes clés en ensembles: un seul test C (isdisjoint) écarte les nodes sans aucune d'elles
+REGION_TAG_SET = frozenset(REGION_TAGS)
+COUNTRY_TAG_SET = frozenset(COUNTRY_TAGS)
+
+
+class CityColumns:
+    """Villes extraites stockées par colonnes (Structure of Arrays).
+
+    Identifiants dans un array.array typé, coordonnées en entiers fixes
+    osmium (1e-7 degré, 4 octets par valeur) converties en degrés par lot
+    via `degrees()`, champs texte dans des listes.
+    """
+
+    FIELDS = ('osm_id', 'name_fr', 'name_en', 'name_local', 'display_name', 'center_lat',
+              'center_lng', 'region_state', 'place_type', 'country_code_from_tags')
 
     def __init__(self):
-        self.osm_id: Optional[int] = None
-        self.name_fr: Optional[str] = None
-        self.name_en: Optional[str] = None
-        self.name_local: Optional[str] = None
-        self.display_name: Optional[str] = None
-        self.center_lat: Optional[float] = None
-        self.center_lng: Optional[float] = None
-        self.region_state: Optional[str] = None
-        self.place_type: Optional[str] = None
-        self.country_code_from_tags: Optional[str] = None
+        self.columns: Dict[str, Any] = {
+            'osm_id': array('q'),
+            'name_fr': [],
+            'name_en': [],
+            'name_local': [],
+            'display_name': [],
+            'center_lat': array('i'),
+            'center_lng': array('i'),
+            'region_state': [],
+            'place_type': [],
+            'country_code_from_tags': [],
+        }
+        # Méthodes append liées, dans l'ordre de FIELDS
+        self._appends = tuple(self.columns[field].append for field in self.FIELDS)
+
+    def append(self, *values):
+        """Ajoute une ville: une valeur par champ, dans l'ordre de FIELDS."""
+        for append, value in zip(self._appends, values):
+            append(value)
+
+    def degrees(self, field: str) -> np.ndarray:
+        """Colonne de coordonnées (center_lat/center_lng) convertie en degrés."""
+        return np.frombuffer(self.columns[field], dtype=np.int32) / COORDINATE_PRECISION
+
+    def select(self, start: int = 0, stop: Optional[int] = None,
+               fields: Sequence[str] = FIELDS) -> Dict[str, List[Any]]:
+        """Colonnes [start:stop) des champs donnés, coordonnées converties en degrés."""
+        if stop is None:
+            stop = len(self)
+
+        columns = {}
+        for field in fields:
+            if field in ('center_lat', 'center_lng'):
+                values = np.frombuffer(self.columns[field], dtype=np.int32)[start:stop]
+                columns[field] = (values / COORDINATE_PRECISION).tolist()
+            else:
+                columns[field] = self.columns[field][start:stop]
+        return columns
+
+    def __len__(self) -> int:
+        return len(self.columns['osm_id'])
 
 
 class CityParser(osmium.SimpleHandler):
@@ -26,120 +104,109 @@ class CityParser(osmium.SimpleHandler):
 
     def __init__(self, progress_tracker=None):
         osmium.SimpleHandler.__init__(self)
-        self.cities: List[CityData] = []
+        self.cities = CityColumns()
         self.progress_tracker = progress_tracker
         self.processed_count = 0
-        self.valid_place_types = {'city', 'town', 'village', 'hamlet'}
 
     def node(self, n):
         """Traite les nœuds OSM pour identifier les villes."""
         try:
-            if not self._is_city(n):
+            # Un seul appel C++ pour écarter les non-villes
+            node_tags = n.tags
+            place = node_tags.get('place')
+            if place not in VALID_PLACE_TYPES:
                 return
+            # Une seule instance de chaîne par type de lieu dans la colonne place_type
+            place = sys.intern(place)
 
-            city = CityData()
-            city.osm_id = n.id
-
-            # Extraire les noms
-            self._extract_names(n, city)
-
-            # Extraire le type de lieu
-            city.place_type = n.tags.get('place')
+            # Copie unique des tags: les extractions suivantes sont de simples
+            # lookups dans un dict Python
+            tags = {tag.k: tag.v for tag in node_tags}
 
-            # Coordonnées
-            city.center_lat = float(n.location.lat)
-            city.center_lng = float(n.location.lon)
-
-            # Région/État amélioré
-            city.region_state = self._extract_region_state(n.tags)
-
-            # Code pays depuis les tags OSM
-            city.country_code_from_tags = self._extract_country_code(n.tags)
+            name_fr, name_en, name_local, display_name = self._extract_names(tags, n.id)
+            if not name_local:
+                return
 
-            if city.name_local:
-                self.cities.append(city)
-                self.processed_count += 1
+            location = n.location
+            if not location.valid():
+                return
 
-                if self.progress_tracker:
-                    self.progress_tracker.update("cities", advance=1)
+            # Coordonnées brutes (entiers), converties en degrés par lot
+            self.cities.append(
+                n.id, name_fr, name_en, name_local, display_name,
+                location.y, location.x,
+                # Région/État amélioré
+                self._extract_region_state(tags),
+                place,
+                # Code pays depuis les tags OSM
+                self._extract_country_code(tags),
+            )
+            self.processed_count += 1
+
+            # Progression regroupée: un seul avancement mis en file du tracker par lot
+            if self.progress_tracker and self.processed_count % PROGRESS_STEP == 0:
+                self.progress_tracker.update("cities", advance=PROGRESS_STEP)
 
         except Exception as e:
             logger.error(f"Erreur traitement ville {n.id}: {e}")
 
-    def _is_city(self, node) -> bool:
-        """Vérifie si le nœud représente une ville."""
-        place = node.tags.get('place')
-        return place in self.valid_place_types
-
-    def _extract_names(self, node, city: CityData):
-        """Extrait les noms dans différentes langues."""
-        tags = node.tags
-
-        city.name_fr = tags.get('name:fr')
-        city.name_en = tags.get('name:en')
-        city.name_local = tags.get('name', tags.get('name:en', tags.get('name:fr')))
-
-        city.display_name = (
-            city.name_fr or
-            city.name_en or
-            city.name_local or
-            f"Ville {node.id}"
+    def finalize(self):
+        """Reporte dans la progression les villes du dernier lot incomplet."""
+        remaining = self.processed_count % PROGRESS_STEP
+        if self.progress_tracker and remaining:
+            self.progress_tracker.update("cities", advance=remaining)
+
+    @staticmethod
+    def _extract_names(tags: Dict[str, str], node_id: int) -> Tuple[Optional[str], ...]:
+        """Extrait les noms dans différentes langues: (fr, en, local, affiché)."""
+        # Une seule recherche par clé; le repli sur name:en/name:fr réutilise
+        # les valeurs déjà lues (name est présent dans la quasi-totalité des cas)
+        name_fr = tags.get('name:fr')
+        name_en = tags.get('name:en')
+        name_local = tags.get('name') or name_en or name_fr
+
+        display_name = (
+            name_fr or
+            name_en or
+            name_local or
+            f"Ville {node_id}"
         )
+        return name_fr, name_en, name_local, display_name
 
-    def _extract_region_state(self, tags: Dict[str, str]) -> Optional[str]:
+    @staticmethod
+    def _extract_region_state(tags: Dict[str, str]) -> Optional[str]:
         """Extrait la région/état avec plusieurs stratégies."""
-        region_tags = [
-            'addr:state',
-            'state',
-            'addr:province',
-            'province',
-            'addr:region',
-            'region',
-            'is_in:state',
-            'is_in:province',
-            'is_in:region'
-        ]
-
-        for tag in region_tags:
-            value = tags.get(tag)
-            if value and value.strip():
-                return value.strip()
-
-        # Parser is_in
+        if not REGION_TAG_SET.isdisjoint(tags):
+            for tag in REGION_TAGS:
+                value = tags.get(tag)
+                if value and value.strip():
+                    return value.strip()
+
+        # Parser is_in: avant-dernier élément, découpé depuis la fin sans split()
         is_in = tags.get('is_in')
         if is_in:
-            parts = [part.strip() for part in is_in.split(',')]
-            if len(parts) >= 2:
-                return parts[-2]
+            head, sep, _ = is_in.rpartition(',')
+            if sep:
+                return head[head.rfind(',') + 1:].strip()
 
         return None
 
-    def _extract_country_code(self, tags: Dict[str, str]) -> Optional[str]:
+    @staticmethod
+    def _extract_country_code(tags: Dict[str, str]) -> Optional[str]:
         """Extrait le code pays depuis les tags OSM."""
-        country_tags = [
-            'addr:country',
-            'country',
-            'addr:country_code',
-            'country_code',
-            'ISO3166-1:alpha2',
-            'is_in:country',
-            'is_in:country_code'
-        ]
-
-        for tag in country_tags:
-            value = tags.get(tag)
-            if value and value.strip():
-                country_code = value.strip().upper()
-                if len(country_code) == 2 and country_code.isalpha():
-                    return country_code
-
-        # Essayer is_in
+        if not COUNTRY_TAG_SET.isdisjoint(tags):
+            for tag in COUNTRY_TAGS:
+                value = tags.get(tag)
+                if value and value.strip():
+                    country_code = value.strip().upper()
+                    if len(country_code) == 2 and country_code.isalpha():
+                        return country_code
+
+        # Essayer is_in: dernier élément uniquement
         is_in = tags.get('is_in')
         if is_in:
-            parts = [part.strip() for part in is_in.split(',')]
-            if parts:
-                last_part = parts[-1].upper()
-                if len(last_part) == 2 and last_part.isalpha():
-                    return last_part
+            last_part = is_in[is_in.rfind(',') + 1:].strip().upper()
+            if len(last_part) == 2 and last_part.isalpha():
+                return last_part
 
         return None
\ No newline at end of file
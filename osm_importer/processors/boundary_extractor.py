@@ -1,237 +1,148 @@
 import osmium
-from typing import Dict, Optional, List, Tuple, Set
+from typing import Optional, List
 import logging
-from collections import defaultdict
+from pathlib import Path
+import hashlib
 import json
-import time
+import os
 
 logger = logging.getLogger(__name__)
 
 
+def country_relation_filters() -> List:
+    """Filtres osmium (C++) ne laissant passer que les relations boundary=administrative + admin_level=2.
+
+    Les autres relations sont écartées avant tout appel Python; nodes et ways ne sont pas concernés.
+    """
+    return [
+        osmium.filter.TagFilter(('boundary', 'administrative')).enable_for(osmium.osm.RELATION),
+        osmium.filter.TagFilter(('admin_level', '2')).enable_for(osmium.osm.RELATION),
+    ]
+
+
+def country_area_filters(country_osm_ids=None) -> List:
+    """Filtres osmium pour l'assemblage des frontières pays.
+
+    Appliqués aux relations (première passe de l'assembleur de multipolygones)
+    et aux areas produites; limités aux relations demandées si précisées.
+    """
+    filters = [
+        osmium.filter.TagFilter(('boundary', 'administrative')).enable_for(osmium.osm.RELATION | osmium.osm.AREA),
+        osmium.filter.TagFilter(('admin_level', '2')).enable_for(osmium.osm.RELATION | osmium.osm.AREA),
+    ]
+    if country_osm_ids:
+        filters.append(osmium.filter.IdFilter(country_osm_ids).enable_for(osmium.osm.RELATION))
+    return filters
+
+
 class BoundaryExtractor:
     """Extracteur de frontières robuste avec debugging détaillé."""
     
-    def __init__(self):
-        self.nodes_cache = {}
-        self.ways_cache = {}
-        self.relations_cache = {}
-        self.country_boundaries = {}
+    def __init__(self, node_cache_dir: Optional[str] = None, as_wkb: bool = False):
+        # Répertoire où conserver l'index des positions des nodes entre deux runs
+        self.node_cache_dir = node_cache_dir
+        # Frontières en WKB (bytes) plutôt qu'en texte GeoJSON (colonne boundaries)
+        self.as_wkb = as_wkb
         
-    def extract_boundaries_from_file(self, osm_file_path: str, country_osm_ids: List[int] = None):
-        """Extrait les frontières pour des pays spécifiques."""
+    def extract_boundaries_from_file(self, osm_file_path: str, country_osm_ids: List[int] = None,
+                                     area_manager: Optional[osmium.area.AreaManager] = None):
+        """Extrait les frontières pour des pays spécifiques.
+
+        Les relations pays sont assemblées en multipolygones par le gestionnaire
+        d'areas d'osmium (anneaux extérieurs/intérieurs, membres non ordonnés);
+        chaque géométrie est retournée en GeoJSON (ou en WKB si `as_wkb`),
+        indexée par ID de relation.
+        Si `area_manager` a déjà reçu les relations (première passe faite par le
+        parser de pays), seule la passe ways/nodes est exécutée. Avec
+        `node_cache_dir`, l'index des positions des nodes est conservé sur disque
+        et les nodes ne sont plus relus tant que le fichier OSM ne change pas.
+        """
         logger.info(f"Extraction des frontières depuis {osm_file_path}")
+        targets = set(country_osm_ids) if country_osm_ids else None
+        as_wkb = self.as_wkb
         
-        # Phase 1: Identifier les relations pays et leurs ways
-        logger.info("Phase 1: Analyse des relations pays...")
-        country_ways = self._find_country_ways(osm_file_path, country_osm_ids)
-        
-        if not country_ways:
-            logger.warning("Aucune relation pays trouvée")
-            return {}
-        
-        logger.info(f"Trouvé {len(country_ways)} pays avec {sum(len(ways) for ways in country_ways.values())} ways")
-        
-        # Phase 2: Extraire les ways nécessaires
-        logger.info("Phase 2: Extraction des ways...")
-        needed_ways = set()
-        for ways in country_ways.values():
-            needed_ways.update(ways)
-        
-        ways_data = self._extract_ways(osm_file_path, needed_ways)
-        logger.info(f"Extrait {len(ways_data)} ways sur {len(needed_ways)} demandés")
-        
-        # Phase 3: Extraire les nodes nécessaires
-        logger.info("Phase 3: Extraction des nodes...")
-        needed_nodes = set()
-        for way_nodes in ways_data.values():
-            needed_nodes.update(way_nodes)
-        
-        nodes_data = self._extract_nodes(osm_file_path, needed_nodes)
-        logger.info(f"Extrait {len(nodes_data)} nodes sur {len(needed_nodes)} demandés")
-        
-        # Phase 4: Construire les géométries
-        logger.info("Phase 4: Construction des géométries...")
-        boundaries = {}
-        
-        for country_id, ways in country_ways.items():
-            try:
-                boundary = self._build_boundary(country_id, ways, ways_data, nodes_data)
-                if boundary:
-                    boundaries[country_id] = boundary
-                    logger.info(f"Frontière construite pour pays {country_id}")
-                else:
-                    logger.warning(f"Échec construction frontière pour pays {country_id}")
-            except Exception as e:
-                logger.error(f"Erreur construction frontière pays {country_id}: {e}")
-        
-        return boundaries
-    
-    def _find_country_ways(self, osm_file_path: str, target_countries: List[int] = None) -> Dict[int, List[int]]:
-        """Trouve les ways pour chaque relation pays."""
-        
-        class RelationFinder(osmium.SimpleHandler):
+        class CountryAreaHandler(osmium.SimpleHandler):
             def __init__(self):
                 osmium.SimpleHandler.__init__(self)
-                self.country_ways = {}
-                self.processed = 0
+                self.factory = osmium.geom.WKBFactory() if as_wkb else osmium.geom.GeoJSONFactory()
+                self.boundaries = {}
             
-            def relation(self, r):
-                self.processed += 1
-                if self.processed % 10000 == 0:
-                    logger.debug(f"Relations traitées: {self.processed}")
+            def area(self, a):
+                # Seules les areas pays arrivent ici (filtrées côté C++); on
+                # écarte celles construites depuis un way fermé
+                if a.from_way():
+                    return
                 
-                # Vérifier si c'est un pays
-                if (r.tags.get('boundary') == 'administrative' and 
-                    r.tags.get('admin_level') == '2'):
-                    
-                    # Filtrer par pays cibles si spécifié
-                    if target_countries and r.id not in target_countries:
-                        return
-                    
-                    name = r.tags.get('name', f'Pays {r.id}')
-                    logger.info(f"Trouvé pays: {name} (ID: {r.id})")
-                    
-                    # Extraire les ways membres
-                    ways = []
-                    for member in r.members:
-                        if member.type == 'w':  # Way
-                            ways.append(member.ref)
-                    
-                    if ways:
-                        self.country_ways[r.id] = ways
-                        logger.info(f"  -> {len(ways)} ways trouvés")
-                    else:
-                        logger.warning(f"  -> Aucun way trouvé pour {name}")
-        
-        handler = RelationFinder()
-        handler.apply_file(osm_file_path)
-        return handler.country_ways
-    
-    def _extract_ways(self, osm_file_path: str, needed_ways: Set[int]) -> Dict[int, List[int]]:
-        """Extrait les ways spécifiés."""
-        
-        class WayExtractor(osmium.SimpleHandler):
-            def __init__(self, target_ways):
-                osmium.SimpleHandler.__init__(self)
-                self.target_ways = target_ways
-                self.ways_data = {}
-                self.processed = 0
-            
-            def way(self, w):
-                self.processed += 1
-                if self.processed % 100000 == 0:
-                    logger.debug(f"Ways traités: {self.processed}, trouvés: {len(self.ways_data)}")
+                country_id = a.orig_id()
+                if targets and country_id not in targets:
+                    return
                 
-                if w.id in self.target_ways:
-                    nodes = [node.ref for node in w.nodes]
-                    self.ways_data[w.id] = nodes
-                    
-                    if len(self.ways_data) % 1000 == 0:
-                        logger.debug(f"Ways extraits: {len(self.ways_data)}/{len(self.target_ways)}")
+                try:
+                    geometry = self.factory.create_multipolygon(a)
+                    # WKBFactory produit du WKB hexadécimal
+                    self.boundaries[country_id] = bytes.fromhex(geometry) if as_wkb else geometry
+                    logger.info(f"Frontière construite pour pays {country_id}")
+                except Exception as e:
+                    logger.error(f"Erreur construction frontière pays {country_id}: {e}")
         
-        handler = WayExtractor(needed_ways)
-        handler.apply_file(osm_file_path)
-        return handler.ways_data
-    
-    def _extract_nodes(self, osm_file_path: str, needed_nodes: Set[int]) -> Dict[int, Tuple[float, float]]:
-        """Extrait les nodes spécifiés."""
+        filters = country_area_filters(targets)
+        handler = CountryAreaHandler()
         
-        class NodeExtractor(osmium.SimpleHandler):
-            def __init__(self, target_nodes):
-                osmium.SimpleHandler.__init__(self)
-                self.target_nodes = target_nodes
-                self.nodes_data = {}
-                self.processed = 0
+        if area_manager is None and self.node_cache_dir is None:
+            handler.apply_file(osm_file_path, filters=filters)
+        else:
+            if area_manager is None:
+                area_manager = osmium.area.AreaManager()
+                with osmium.io.Reader(osm_file_path, osmium.osm.RELATION) as reader:
+                    osmium.apply(reader, *filters, area_manager.first_pass_handler())
             
-            def node(self, n):
-                self.processed += 1
-                if self.processed % 1000000 == 0:
-                    logger.debug(f"Nodes traités: {self.processed}, trouvés: {len(self.nodes_data)}")
-                
-                if n.id in self.target_nodes:
-                    self.nodes_data[n.id] = (n.location.lon, n.location.lat)
-                    
-                    if len(self.nodes_data) % 10000 == 0:
-                        logger.debug(f"Nodes extraits: {len(self.nodes_data)}/{len(self.target_nodes)}")
+            # Relations déjà connues de l'assembleur: seule la passe ways/nodes reste
+            self._assemble_areas(osm_file_path, area_manager, filters, handler)
         
-        handler = NodeExtractor(needed_nodes)
-        handler.apply_file(osm_file_path)
-        return handler.nodes_data
-    
-    def _build_boundary(self, country_id: int, ways: List[int], 
-                       ways_data: Dict[int, List[int]], 
-                       nodes_data: Dict[int, Tuple[float, float]]) -> Optional[str]:
-        """Construit la géométrie d'un pays."""
+        if not handler.boundaries:
+            logger.warning("Aucune frontière pays construite")
         
-        logger.info(f"Construction frontière pays {country_id} avec {len(ways)} ways")
+        return handler.boundaries
+    
+    def _assemble_areas(self, osm_file_path: str, area_manager, filters: List, handler):
+        """Seconde passe de l'assembleur, avec l'index des positions éventuellement en cache."""
+        cache_path = self._node_cache_path(osm_file_path)
+        partial_path = None
         
-        # Convertir les ways en coordonnées
-        way_coordinates = {}
-        valid_ways = 0
+        if cache_path is None:
+            index, entities = osmium.index.create_map('flex_mem'), osmium.osm.OBJECT
+        elif cache_path.exists():
+            # Positions indexées lors d'un run précédent: seuls les ways sont lus
+            logger.info(f"Index des nodes en cache: {cache_path}")
+            index, entities = osmium.index.create_map(f'dense_file_array,{cache_path}'), osmium.osm.WAY
+        else:
+            # Écrit sous un nom temporaire, renommé une fois la passe terminée
+            partial_path = cache_path.with_suffix('.tmp')
+            partial_path.unlink(missing_ok=True)
+            index, entities = osmium.index.create_map(f'dense_file_array,{partial_path}'), osmium.osm.OBJECT
         
-        for way_id in ways:
-            if way_id not in ways_data:
-                logger.debug(f"Way {way_id} non trouvé dans les données")
-                continue
-                
-            node_ids = ways_data[way_id]
-            coords = []
-            
-            for node_id in node_ids:
-                if node_id in nodes_data:
-                    coords.append(nodes_data[node_id])
-                else:
-                    logger.debug(f"Node {node_id} non trouvé")
-            
-            if len(coords) >= 2:
-                way_coordinates[way_id] = coords
-                valid_ways += 1
-            else:
-                logger.debug(f"Way {way_id} invalide: {len(coords)} coordonnées")
+        locations = osmium.NodeLocationsForWays(index)
+        locations.ignore_errors()
+        with osmium.io.Reader(osm_file_path, entities) as reader:
+            osmium.apply(reader, locations, area_manager.second_pass_handler(*filters, handler))
         
-        logger.info(f"Ways valides: {valid_ways}/{len(ways)}")
-        
-        if not way_coordinates:
-            logger.warning(f"Aucun way valide pour pays {country_id}")
+        if partial_path is not None:
+            partial_path.rename(cache_path)
+            logger.info(f"Index des nodes sauvegardé: {cache_path}")
+    
+    def _node_cache_path(self, osm_file_path: str) -> Optional[Path]:
+        """Chemin de l'index des nodes, propre au fichier OSM (chemin, taille, date de modification)."""
+        if not self.node_cache_dir:
             return None
         
-        # Essayer de construire un polygone simple
-        try:
-            # Méthode 1: Concaténer tous les ways (approximatif)
-            all_coords = []
-            for coords in way_coordinates.values():
-                all_coords.extend(coords)
-            
-            if len(all_coords) < 3:
-                logger.warning(f"Pas assez de coordonnées: {len(all_coords)}")
-                return None
-            
-            # Supprimer les doublons consécutifs
-            unique_coords = [all_coords[0]]
-            for coord in all_coords[1:]:
-                if coord != unique_coords[-1]:
-                    unique_coords.append(coord)
-            
-            # Fermer le polygone
-            if len(unique_coords) >= 3 and unique_coords[0] != unique_coords[-1]:
-                unique_coords.append(unique_coords[0])
-            
-            if len(unique_coords) < 4:  # Besoin d'au moins 4 points pour un polygone fermé
-                logger.warning(f"Polygone trop petit: {len(unique_coords)} points")
-                return None
-            
-            # Créer le GeoJSON
-            geojson = {
-                "type": "Polygon",
-                "coordinates": [[[coord[0], coord[1]] for coord in unique_coords]]
-            }
-            
-            logger.info(f"Polygone créé avec {len(unique_coords)} points")
-            return json.dumps(geojson)
-            
-        except Exception as e:
-            logger.error(f"Erreur construction polygone: {e}")
-            return None
+        stat = os.stat(osm_file_path)
+        key = hashlib.sha1(
+            f"{os.path.abspath(osm_file_path)}:{stat.st_size}:{stat.st_mtime_ns}".encode()
+        ).hexdigest()[:16]
+        
+        cache_dir = Path(self.node_cache_dir)
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        return cache_dir / f"{Path(osm_file_path).name}.{key}.nodes"
 
 
 # Version simplifiée du CountryParser
@@ -244,9 +155,23 @@ class CountryParserSimplified(osmium.SimpleHandler):
         self.progress_tracker = progress_tracker
         self.processed_count = 0
         self.country_ids = []  # Pour stocker les IDs des pays trouvés
+        # Alimenté par parse_file: les frontières n'exigent plus de relire les relations
+        self.area_manager = osmium.area.AreaManager()
+        self.area_manager_fed = False
+
+    def parse_file(self, osm_file_path: str):
+        """Parse les relations pays en alimentant l'assembleur de multipolygones."""
+        with osmium.io.Reader(osm_file_path, osmium.osm.RELATION) as reader:
+            osmium.apply(reader, *country_relation_filters(),
+                         self.area_manager.first_pass_handler(), self)
+        self.area_manager_fed = True
 
     def relation(self, r):
-        """Collecte les métadonnées des pays."""
+        """Collecte les métadonnées des pays.
+
+        Les relations sont déjà filtrées côté C++ par parse_file; le test de tags
+        reste pour les appels directs (apply_file, parser combiné).
+        """
         try:
             if not self._is_country(r):
                 return
@@ -305,9 +230,13 @@ class CountryParserSimplified(osmium.SimpleHandler):
 
         logger.info(f"Post-traitement: extraction des frontières pour {len(self.country_ids)} pays")
         
-        # Utiliser l'extracteur de frontières
+        # Utiliser l'extracteur de frontières; sans passe parse_file, l'assembleur
+        # est vide et l'extracteur relit lui-même les relations
         extractor = BoundaryExtractor()
-        boundaries = extractor.extract_boundaries_from_file(osm_file_path, self.country_ids)
+        boundaries = extractor.extract_boundaries_from_file(
+            osm_file_path, self.country_ids,
+            area_manager=self.area_manager if self.area_manager_fed else None
+        )
         
         # Mettre à jour les frontières
         updated_count = 0
@@ -340,21 +269,18 @@ def test_boundary_extraction(osm_file_path: str, country_name: str = None):
             self.found_countries = []
         
         def relation(self, r):
-            if (r.tags.get('boundary') == 'administrative' and 
-                r.tags.get('admin_level') == '2'):
-                
-                name = r.tags.get('name', '')
-                if not self.target_name or self.target_name in name.lower():
-                    self.found_countries.append({
-                        'id': r.id,
-                        'name': name,
-                        'code': r.tags.get('ISO3166-1:alpha2', 'N/A')
-                    })
-                    logger.info(f"Pays trouvé: {name} (ID: {r.id}, Code: {r.tags.get('ISO3166-1:alpha2', 'N/A')})")
+            name = r.tags.get('name', '')
+            if not self.target_name or self.target_name in name.lower():
+                self.found_countries.append({
+                    'id': r.id,
+                    'name': name,
+                    'code': r.tags.get('ISO3166-1:alpha2', 'N/A')
+                })
+                logger.info(f"Pays trouvé: {name} (ID: {r.id}, Code: {r.tags.get('ISO3166-1:alpha2', 'N/A')})")
     
-    # Chercher les pays
+    # Chercher les pays (relations non-pays écartées côté C++)
     finder = CountryFinder(country_name)
-    finder.apply_file(osm_file_path)
+    finder.apply_file(osm_file_path, filters=country_relation_filters())
     
     if not finder.found_countries:
         logger.error("Aucun pays trouvé")
@@ -365,16 +291,15 @@ def test_boundary_extraction(osm_file_path: str, country_name: str = None):
     logger.info(f"Test avec: {test_country['name']} (ID: {test_country['id']})")
     
     # Extraire les frontières
-    extractor = BoundaryExtractor()
+    extractor = BoundaryExtractor(as_wkb=True)
     boundaries = extractor.extract_boundaries_from_file(osm_file_path, [test_country['id']])
     
     if test_country['id'] in boundaries:
-        boundary_geojson = boundaries[test_country['id']]
-        
-        # Analyser le résultat
-        import json
-        geom = json.loads(boundary_geojson)
-        coords = geom['coordinates'][0] if geom['coordinates'] else []
+        # Analyser le résultat directement sur la géométrie (WKB, sans passer par du texte)
+        import shapely
+        geom = shapely.from_wkb(boundaries[test_country['id']])
+        # Anneau extérieur du premier polygone
+        coords = list(geom.geoms[0].exterior.coords) if not geom.is_empty else []
         
         logger.info(f"Succès ! Frontière extraite avec {len(coords)} points")
         logger.info(f"Premier point: {coords[0] if coords else 'N/A'}")
@@ -383,7 +308,7 @@ def test_boundary_extraction(osm_file_path: str, country_name: str = None):
         # Sauvegarder pour inspection
         output_file = f"boundary_{test_country['code']}_{test_country['id']}.geojson"
         with open(output_file, 'w') as f:
-            json.dump(geom, f, indent=2)
+            f.write(shapely.to_geojson(geom, indent=2))
         logger.info(f"Frontière sauvegardée: {output_file}")
         
     else:
@@ -1,20 +1,72 @@
-import json
+import heapq
 import logging
-from typing import List, Dict, Any, Optional
-import math
+from typing import List, Dict, Any, Optional, Tuple
+import numpy as np
+import orjson
 
 logger = logging.getLogger(__name__)
 
 
+def _farthest_point(coords: np.ndarray, lo: int, hi: int) -> Tuple[float, int]:
+    """Point intermédiaire le plus éloigné de la ligne lo-hi: (distance au carré, indice)."""
+    # Distances (au carré) de tous les points intermédiaires à la ligne lo-hi
+    x0, y0 = coords[lo]
+    dx, dy = coords[hi] - coords[lo]
+    inner = coords[lo + 1:hi]
+    segment_sq = dx * dx + dy * dy
+
+    if segment_sq == 0:
+        # Si la ligne est un point
+        distances_sq = (inner[:, 0] - x0) ** 2 + (inner[:, 1] - y0) ** 2
+    else:
+        numerator = dy * (inner[:, 0] - x0) - dx * (inner[:, 1] - y0)
+        distances_sq = numerator * numerator / segment_sq
+
+    offset = int(np.argmax(distances_sq))
+    return float(distances_sq[offset]), lo + 1 + offset
+
+
+def _douglas_peucker_mask(coords: np.ndarray, lo: int, hi: int, tolerance_sq: float,
+                          keep: np.ndarray, max_vertices: Optional[int] = None) -> None:
+    """Noyau Douglas-Peucker entre les indices lo et hi (sans copie du tableau).
+
+    Version itérative sur une file de priorité de segments (lo, hi), le plus
+    éloigné de sa corde d'abord: pas de récursion, et arrêt anticipé dès que
+    `max_vertices` points sont conservés (taille de sortie bornée). Marque dans
+    `keep` les points conservés (lo et hi sont marqués par l'appelant); les
+    distances sont comparées au carré de la tolérance (pas de racine carrée).
+    """
+    kept = 2 if hi > lo else 1
+    heap = []
+
+    def push(lo: int, hi: int):
+        if hi - lo >= 2:
+            distance_sq, split = _farthest_point(coords, lo, hi)
+            # Seuls les segments au-delà de la tolérance sont à subdiviser
+            if distance_sq > tolerance_sq:
+                heapq.heappush(heap, (-distance_sq, split, lo, hi))
+
+    push(lo, hi)
+    while heap and (max_vertices is None or kept < max_vertices):
+        _, split, lo, hi = heapq.heappop(heap)
+        keep[split] = True
+        kept += 1
+        push(lo, split)
+        push(split, hi)
+
+
 class BoundarySimplifier:
     """Simplificateur de frontières géographiques sans Shapely."""
 
-    def __init__(self, tolerance: float = 0.01):
+    def __init__(self, tolerance: float = 0.01, max_vertices: Optional[int] = None):
         """
         Args:
             tolerance: Tolérance de simplification en degrés (~1km pour 0.01°)
+            max_vertices: Nombre maximal de points conservés par frontière
+                (None, par défaut: sans limite, seule la tolérance arrête la simplification)
         """
         self.tolerance = tolerance
+        self.max_vertices = max_vertices
 
     def simplify_boundary(self, geometry_data: List[Dict]) -> Optional[str]:
         """Simplifie une frontière et retourne le GeoJSON."""
@@ -25,14 +77,19 @@ class BoundarySimplifier:
             if not coordinates:
                 return None
 
-            # Simplifier avec Douglas-Peucker
-            simplified_coords = self._douglas_peucker_simplify(coordinates, self.tolerance)
+            # Simplifier avec Douglas-Peucker sur un tableau (N, 2): les points
+            # conservés sont marqués dans un masque, indexé une seule fois
+            coords = np.asarray(coordinates, dtype=np.float64).reshape(-1, 2)
+            keep = np.zeros(len(coords), dtype=bool)
+            keep[0] = keep[-1] = True
+            _douglas_peucker_mask(coords, 0, len(coords) - 1, self.tolerance ** 2, keep,
+                                  self.max_vertices)
 
             # Convertir en GeoJSON
-            return self._to_geojson(simplified_coords)
+            return self._to_geojson(coords[keep])
 
         except Exception as e:
-            logger.error(f"Erreur simplification frontière: {e}")
+            logger.error("Erreur simplification frontière: %s", e)
             return None
 
     def _extract_coordinates(self, geometry_data: List[Dict]) -> List[tuple]:
@@ -45,69 +102,28 @@ class BoundarySimplifier:
                     coords = [(float(node['lon']), float(node['lat'])) for node in geom['nodes']]
                     coordinates.extend(coords)
             except Exception as e:
-                logger.warning(f"Erreur extraction coordonnées: {e}")
+                logger.warning("Erreur extraction coordonnées: %s", e)
                 continue
 
         return coordinates
 
-    def _douglas_peucker_simplify(self, coordinates: List[tuple], tolerance: float) -> List[tuple]:
-        """Algorithme Douglas-Peucker pour simplifier une ligne."""
-        if len(coordinates) <= 2:
-            return coordinates
-
-        # Trouver le point le plus éloigné de la ligne start-end
-        start = coordinates[0]
-        end = coordinates[-1]
-        max_distance = 0
-        max_index = 0
-
-        for i in range(1, len(coordinates) - 1):
-            distance = self._perpendicular_distance(coordinates[i], start, end)
-            if distance > max_distance:
-                max_distance = distance
-                max_index = i
-
-        # Si la distance max est supérieure à la tolérance, subdiviser
-        if max_distance > tolerance:
-            # Récursion sur les deux segments
-            left = self._douglas_peucker_simplify(coordinates[:max_index + 1], tolerance)
-            right = self._douglas_peucker_simplify(coordinates[max_index:], tolerance)
-
-            # Combiner (éviter la duplication du point de jonction)
-            return left[:-1] + right
-        else:
-            # Tous les points intermédiaires peuvent être supprimés
-            return [start, end]
-
-    def _perpendicular_distance(self, point: tuple, line_start: tuple, line_end: tuple) -> float:
-        """Calcule la distance perpendiculaire d'un point à une ligne."""
-        x0, y0 = point
-        x1, y1 = line_start
-        x2, y2 = line_end
+    def _to_geojson(self, coordinates: np.ndarray) -> str:
+        """Convertit un tableau (N, 2) de coordonnées en GeoJSON.
 
-        # Si la ligne est un point
-        if x1 == x2 and y1 == y2:
-            return math.sqrt((x0 - x1)**2 + (y0 - y1)**2)
-
-        # Distance perpendiculaire à la ligne
-        numerator = abs((y2 - y1) * x0 - (x2 - x1) * y0 + x2 * y1 - y2 * x1)
-        denominator = math.sqrt((y2 - y1)**2 + (x2 - x1)**2)
-
-        return numerator / denominator if denominator != 0 else 0
-
-    def _to_geojson(self, coordinates: List[tuple]) -> str:
-        """Convertit des coordonnées en GeoJSON."""
+        Le tableau est sérialisé directement par orjson (sans liste Python
+        intermédiaire).
+        """
         if len(coordinates) < 3:
-            return json.dumps({
+            return orjson.dumps({
                 "type": "Polygon",
                 "coordinates": [[]]
-            })
+            }).decode()
 
         # Fermer le polygone si nécessaire
-        if coordinates[0] != coordinates[-1]:
-            coordinates.append(coordinates[0])
+        if (coordinates[0] != coordinates[-1]).any():
+            coordinates = np.vstack((coordinates, coordinates[:1]))
 
-        return json.dumps({
+        return orjson.dumps({
             "type": "Polygon",
-            "coordinates": [coordinates]
-        })
+            "coordinates": [np.ascontiguousarray(coordinates)]
+        }, option=orjson.OPT_SERIALIZE_NUMPY).decode()
@@ -1,17 +1,76 @@
 from timezonefinder import TimezoneFinder
 import pycountry
+import numpy as np
+from functools import lru_cache
 from typing import Optional, List, Dict
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Précision (en décimales) des coordonnées pour le cache des timezones:
+# ~1 km, les limites de fuseaux ne bougent pas à cette échelle
+TIMEZONE_PRECISION = 2
+
+# Continent et région par pays
+# Mapping simplifié - en production, utiliser une source plus complète
+CONTINENT_MAP = {
+    'FR': {'continent': 'Europe', 'region': 'Western Europe'},
+    'DE': {'continent': 'Europe', 'region': 'Western Europe'},
+    'IT': {'continent': 'Europe', 'region': 'Southern Europe'},
+    'ES': {'continent': 'Europe', 'region': 'Southern Europe'},
+    'GB': {'continent': 'Europe', 'region': 'Northern Europe'},
+    'US': {'continent': 'North America', 'region': 'Northern America'},
+    'CA': {'continent': 'North America', 'region': 'Northern America'},
+    'BR': {'continent': 'South America', 'region': 'South America'},
+    'AR': {'continent': 'South America', 'region': 'South America'},
+    'CN': {'continent': 'Asia', 'region': 'Eastern Asia'},
+    'JP': {'continent': 'Asia', 'region': 'Eastern Asia'},
+    'IN': {'continent': 'Asia', 'region': 'Southern Asia'},
+    'AU': {'continent': 'Oceania', 'region': 'Australia and New Zealand'},
+    'ZA': {'continent': 'Africa', 'region': 'Southern Africa'},
+    'EG': {'continent': 'Africa', 'region': 'Northern Africa'},
+    'NG': {'continent': 'Africa', 'region': 'Western Africa'},
+    # Ajouter d'autres pays selon les besoins
+}
+
+# Monnaie par pays (mapping simplifié)
+CURRENCY_MAP = {
+    'FR': 'EUR', 'DE': 'EUR', 'IT': 'EUR', 'ES': 'EUR',
+    'US': 'USD', 'CA': 'CAD', 'GB': 'GBP', 'JP': 'JPY',
+    'CN': 'CNY', 'IN': 'INR', 'BR': 'BRL', 'AU': 'AUD',
+    'ZA': 'ZAR', 'CH': 'CHF', 'SE': 'SEK', 'NO': 'NOK'
+}
+
+# Langues officielles par pays (mapping simplifié)
+LANGUAGE_MAP = {
+    'FR': ['fr'], 'DE': ['de'], 'IT': ['it'], 'ES': ['es'],
+    'GB': ['en'], 'US': ['en'], 'CA': ['en', 'fr'],
+    'JP': ['ja'], 'CN': ['zh'], 'IN': ['hi', 'en'],
+    'BR': ['pt'], 'AR': ['es'], 'AU': ['en'],
+    'ZA': ['af', 'en'], 'CH': ['de', 'fr', 'it']
+}
+
+
+@lru_cache(maxsize=None)
+def _timezone_finder() -> TimezoneFinder:
+    """TimezoneFinder unique par processus, données chargées en mémoire une fois."""
+    return TimezoneFinder(in_memory=True)
+
+
+@lru_cache(maxsize=512)
+def _country_info(alpha2: str):
+    """Recherche pycountry mise en cache par code alpha2."""
+    return pycountry.countries.get(alpha_2=alpha2)
+
 
 class DataEnricher:
     """Enrichit les données géographiques avec des informations supplémentaires."""
 
     def __init__(self):
-        self.timezone_finder = TimezoneFinder()
-        self.continent_map = self._build_continent_map()
+        self.timezone_finder = _timezone_finder()
+        # Cache par instance (pas de référence à self gardée par un cache global)
+        self._timezone_cache = lru_cache(maxsize=4096)(self._lookup_timezone)
+        self.continent_map = CONTINENT_MAP
 
     def enrich_country(self, country_data) -> Dict:
         """Enrichit les données d'un pays."""
@@ -20,22 +79,23 @@ class DataEnricher:
         try:
             # Timezone (approximative depuis le centre)
             if country_data.center_lat and country_data.center_lng:
-                timezone = self.timezone_finder.timezone_at(
-                    lat=float(country_data.center_lat),
-                    lng=float(country_data.center_lng)
-                )
+                timezone = self._timezone_at(country_data.center_lat, country_data.center_lng)
                 enriched['timezones'] = [timezone] if timezone else []
 
+            # Code alpha2 normalisé une seule fois pour toutes les recherches
+            alpha2 = country_data.country_code_alpha2
+            alpha2 = alpha2.upper() if alpha2 else None
+
             # Continent et région
-            if country_data.country_code_alpha2:
-                continent_info = self.continent_map.get(country_data.country_code_alpha2.upper())
+            if alpha2:
+                continent_info = self.continent_map.get(alpha2)
                 if continent_info:
                     enriched['continent'] = continent_info['continent']
                     enriched['region'] = continent_info['region']
 
             # Informations depuis pycountry
-            if country_data.country_code_alpha2:
-                country_info = pycountry.countries.get(alpha_2=country_data.country_code_alpha2.upper())
+            if alpha2:
+                country_info = _country_info(alpha2)
                 if country_info:
                     # Code alpha3 si manquant
                     if not country_data.country_code_alpha3:
@@ -46,13 +106,13 @@ class DataEnricher:
                         enriched['name_en'] = country_info.name
 
             # Monnaie (mapping basique)
-            enriched['currency_code'] = self._get_currency_code(country_data.country_code_alpha2)
+            enriched['currency_code'] = self._get_currency_code(alpha2)
 
             # Langues officielles (mapping basique)
-            enriched['official_languages'] = self._get_official_languages(country_data.country_code_alpha2)
+            enriched['official_languages'] = self._get_official_languages(alpha2)
 
         except Exception as e:
-            logger.error(f"Erreur enrichissement pays {country_data.osm_id}: {e}")
+            logger.error("Erreur enrichissement pays %s: %s", country_data.osm_id, e)
 
         return enriched
 
@@ -63,65 +123,62 @@ class DataEnricher:
         try:
             # Timezone
             if city_data.center_lat and city_data.center_lng:
-                timezone = self.timezone_finder.timezone_at(
-                    lat=float(city_data.center_lat),
-                    lng=float(city_data.center_lng)
-                )
+                timezone = self._timezone_at(city_data.center_lat, city_data.center_lng)
                 enriched['timezone'] = timezone
 
         except Exception as e:
-            logger.error(f"Erreur enrichissement ville {city_data.osm_id}: {e}")
+            logger.error("Erreur enrichissement ville %s: %s", city_data.osm_id, e)
 
         return enriched
 
-    def _build_continent_map(self) -> Dict[str, Dict[str, str]]:
-        """Construit la carte des continents et régions."""
-        # Mapping simplifié - en production, utiliser une source plus complète
-        return {
-            'FR': {'continent': 'Europe', 'region': 'Western Europe'},
-            'DE': {'continent': 'Europe', 'region': 'Western Europe'},
-            'IT': {'continent': 'Europe', 'region': 'Southern Europe'},
-            'ES': {'continent': 'Europe', 'region': 'Southern Europe'},
-            'GB': {'continent': 'Europe', 'region': 'Northern Europe'},
-            'US': {'continent': 'North America', 'region': 'Northern America'},
-            'CA': {'continent': 'North America', 'region': 'Northern America'},
-            'BR': {'continent': 'South America', 'region': 'South America'},
-            'AR': {'continent': 'South America', 'region': 'South America'},
-            'CN': {'continent': 'Asia', 'region': 'Eastern Asia'},
-            'JP': {'continent': 'Asia', 'region': 'Eastern Asia'},
-            'IN': {'continent': 'Asia', 'region': 'Southern Asia'},
-            'AU': {'continent': 'Oceania', 'region': 'Australia and New Zealand'},
-            'ZA': {'continent': 'Africa', 'region': 'Southern Africa'},
-            'EG': {'continent': 'Africa', 'region': 'Northern Africa'},
-            'NG': {'continent': 'Africa', 'region': 'Western Africa'},
-            # Ajouter d'autres pays selon les besoins
-        }
+    def enrich_cities_bulk(self, lats: List[Optional[float]], lngs: List[Optional[float]]) -> Dict[str, List]:
+        """Enrichit un lot de villes donné par colonnes; retourne les colonnes ajoutées.
+
+        Les coordonnées sont regroupées par tuile de TIMEZONE_PRECISION
+        décimales (clé entière unique par tuile): la timezone n'est calculée
+        qu'une fois par tuile puis redistribuée (None sans coordonnées).
+        """
+        scale = 10 ** TIMEZONE_PRECISION
+        coords = np.column_stack((
+            np.asarray(lats, dtype=float),
+            np.asarray(lngs, dtype=float)
+        ))
+        valid = np.flatnonzero(np.isfinite(coords).all(axis=1) & (coords != 0).all(axis=1))
+
+        tiles = np.round(coords[valid] * scale).astype(np.int64)
+        keys = (tiles[:, 0] + 90 * scale) * (360 * scale + 1) + (tiles[:, 1] + 180 * scale)
+        _, first, inverse = np.unique(keys, return_index=True, return_inverse=True)
+        unique_coords = tiles[first] / scale
+
+        zones = []
+        for lat, lng in unique_coords.tolist():
+            try:
+                zones.append(self._timezone_at(lat, lng))
+            except Exception as e:
+                logger.error("Erreur timezone (%s, %s): %s", lat, lng, e)
+                zones.append(None)
+
+        timezones = [None] * len(coords)
+        for index, zone in zip(valid.tolist(), inverse.ravel().tolist()):
+            timezones[index] = zones[zone]
+
+        return {'timezone': timezones}
+
+    def _timezone_at(self, lat, lng) -> Optional[str]:
+        """Timezone d'une coordonnée, arrondie puis mise en cache."""
+        return self._timezone_cache(
+            round(float(lat), TIMEZONE_PRECISION),
+            round(float(lng), TIMEZONE_PRECISION)
+        )
+
+    def _lookup_timezone(self, lat: float, lng: float) -> Optional[str]:
+        """Recherche TimezoneFinder brute (appelée via le cache)."""
+        return self.timezone_finder.timezone_at(lat=lat, lng=lng)
 
     def _get_currency_code(self, country_code: Optional[str]) -> Optional[str]:
-        """Retourne le code monnaie pour un pays."""
-        if not country_code:
-            return None
-
-        # Mapping simplifié
-        currency_map = {
-            'FR': 'EUR', 'DE': 'EUR', 'IT': 'EUR', 'ES': 'EUR',
-            'US': 'USD', 'CA': 'CAD', 'GB': 'GBP', 'JP': 'JPY',
-            'CN': 'CNY', 'IN': 'INR', 'BR': 'BRL', 'AU': 'AUD',
-            'ZA': 'ZAR', 'CH': 'CHF', 'SE': 'SEK', 'NO': 'NOK'
-        }
-        return currency_map.get(country_code.upper())
+        """Retourne le code monnaie pour un pays (code alpha2 en majuscules)."""
+        return CURRENCY_MAP.get(country_code) if country_code else None
 
     def _get_official_languages(self, country_code: Optional[str]) -> List[str]:
-        """Retourne les langues officielles d'un pays."""
-        if not country_code:
-            return []
-
-        # Mapping simplifié
-        language_map = {
-            'FR': ['fr'], 'DE': ['de'], 'IT': ['it'], 'ES': ['es'],
-            'GB': ['en'], 'US': ['en'], 'CA': ['en', 'fr'],
-            'JP': ['ja'], 'CN': ['zh'], 'IN': ['hi', 'en'],
-            'BR': ['pt'], 'AR': ['es'], 'AU': ['en'],
-            'ZA': ['af', 'en'], 'CH': ['de', 'fr', 'it']
-        }
-        return language_map.get(country_code.upper(), [])
+        """Retourne les langues officielles d'un pays (code alpha2 en majuscules)."""
+        return list(LANGUAGE_MAP.get(country_code, ())) if country_code else []
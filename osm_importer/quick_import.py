@@ -6,6 +6,7 @@ import os
 import asyncio
 import osmium
 import time
+import threading
 from pathlib import Path
 from rich.progress import Progress, BarColumn, TextColumn, SpinnerColumn
 from rich.console import Console
@@ -16,6 +17,11 @@ sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 from osm_importer.config import Config
 from osm_importer.database.connection import DatabaseManager
 from osm_importer.database.operations import DatabaseOperations
+from osm_importer.parsers.city_parser import VALID_PLACE_TYPES, CityColumns
+
+# Champs de ville renseignés par le parser rapide
+CITY_FIELDS = ('osm_id', 'name_local', 'name_fr', 'name_en', 'display_name',
+               'center_lat', 'center_lng', 'place_type')
 
 
 class FastOSMParser(osmium.SimpleHandler):
@@ -25,55 +31,71 @@ class FastOSMParser(osmium.SimpleHandler):
         osmium.SimpleHandler.__init__(self)
         self.console = console
         self.countries = []
-        self.cities = []
+        # Villes stockées par colonnes (Structure of Arrays)
+        self.cities = CityColumns()
         self.processed = 0
         self.start_time = time.time()
         self.last_update = 0
 
     def relation(self, r):
-        """Traite les relations (pays)."""
-        if (r.tags.get('boundary') == 'administrative' and
-            r.tags.get('admin_level') == '2'):
-
-            country_data = {
-                'osm_id': r.id,
-                'name_local': r.tags.get('name', f'Pays {r.id}'),
-                'name_fr': r.tags.get('name:fr'),
-                'name_en': r.tags.get('name:en'),
-                'display_name': r.tags.get('name', f'Pays {r.id}'),
-                'country_code_alpha2': r.tags.get('ISO3166-1:alpha2'),
-                'country_code_alpha3': r.tags.get('ISO3166-1:alpha3'),
-                'boundaries': '{"type":"Polygon","coordinates":[[]]}'
-            }
-            self.countries.append(country_data)
-
-        self._update_progress()
+        """Traite les relations (pays, déjà filtrées côté C++)."""
+        tags = r.tags
+        alpha2 = tags.get('ISO3166-1:alpha2')
+        alpha3 = tags.get('ISO3166-1:alpha3')
+        country_data = {
+            'osm_id': r.id,
+            'name_local': tags.get('name', f'Pays {r.id}'),
+            'name_fr': tags.get('name:fr'),
+            'name_en': tags.get('name:en'),
+            'display_name': tags.get('name', f'Pays {r.id}'),
+            # Codes ISO internés: une seule chaîne partagée par valeur
+            'country_code_alpha2': sys.intern(alpha2) if alpha2 else alpha2,
+            'country_code_alpha3': sys.intern(alpha3) if alpha3 else alpha3,
+            'boundaries': '{"type":"Polygon","coordinates":[[]]}'
+        }
+        self.countries.append(country_data)
+        self.processed += 1
 
     def node(self, n):
-        """Traite les nœuds (villes)."""
+        """Traite les nœuds (villes, déjà filtrés côté C++)."""
         place_type = n.tags.get('place')
-        if place_type in {'city', 'town', 'village', 'hamlet'}:
-
-            city_data = {
-                'osm_id': n.id,
-                'name_local': n.tags.get('name', f'Ville {n.id}'),
-                'name_fr': n.tags.get('name:fr'),
-                'name_en': n.tags.get('name:en'),
-                'display_name': n.tags.get('name', f'Ville {n.id}'),
-                'center_lat': float(n.location.lat),
-                'center_lng': float(n.location.lon),
-                'place_type': place_type
-            }
-            self.cities.append(city_data)
-
-        self._update_progress()
-
-    def _update_progress(self):
-        """Met à jour l'affichage de progression."""
+        if place_type in VALID_PLACE_TYPES:
+            place_type = sys.intern(place_type)
+
+            location = n.location
+            if location.valid():
+                tags = n.tags
+                name = tags.get('name', f'Ville {n.id}')
+                self.cities.append(
+                    n.id, tags.get('name:fr'), tags.get('name:en'), name, name,
+                    location.y, location.x, None, place_type, None
+                )
+
         self.processed += 1
 
-        # Afficher toutes les 100000 éléments
-        if self.processed % 100000 == 0:
+    def apply_with_progress(self, parse, interval: float = 1.0):
+        """Exécute parse() en affichant la progression depuis un thread d'échantillonnage.
+
+        Les callbacks ne font qu'incrémenter le compteur: l'affichage est fait
+        toutes les `interval` secondes, hors du parcours du fichier.
+        """
+        stop = threading.Event()
+
+        def sample():
+            while not stop.wait(interval):
+                self._print_progress()
+
+        sampler = threading.Thread(target=sample, daemon=True)
+        sampler.start()
+        try:
+            parse()
+        finally:
+            stop.set()
+            sampler.join()
+
+    def _print_progress(self):
+        """Affiche la progression courante."""
+        if self.processed:
             elapsed = time.time() - self.start_time
             rate = self.processed / elapsed if elapsed > 0 else 0
 
@@ -85,6 +107,18 @@ class FastOSMParser(osmium.SimpleHandler):
             )
 
 
+def _parse_filters():
+    """Filtres osmium (C++): les relations non-pays et les nodes sans place=* de
+    ville sont écartés avant d'atteindre Python."""
+    return [
+        osmium.filter.TagFilter(('boundary', 'administrative')).enable_for(osmium.osm.RELATION),
+        osmium.filter.TagFilter(('admin_level', '2')).enable_for(osmium.osm.RELATION),
+        osmium.filter.TagFilter(
+            ('place', 'city'), ('place', 'town'), ('place', 'village'), ('place', 'hamlet')
+        ).enable_for(osmium.osm.NODE),
+    ]
+
+
 async def fast_import(osm_file: Path, config_file: Path):
     """Import rapide sans barres de progression complexes."""
     console = Console()
@@ -118,9 +152,11 @@ async def fast_import(osm_file: Path, config_file: Path):
         task = progress.add_task("parsing", total=None)
 
         def parse_file():
-            parser.apply_file(str(osm_file))
+            parser.apply_file(str(osm_file), filters=_parse_filters())
 
-        await asyncio.get_event_loop().run_in_executor(None, parse_file)
+        # Une seule passe filtrée: pyosmium ne découpe pas un fichier par blocs, et
+        # libosmium décompresse déjà les blocs sur plusieurs threads
+        await asyncio.get_event_loop().run_in_executor(None, parser.apply_with_progress, parse_file)
 
     parse_time = time.time() - start_time
     console.print(f"[green]✅ Parsing terminé en {parse_time:.1f}s[/green]")
@@ -131,26 +167,45 @@ async def fast_import(osm_file: Path, config_file: Path):
     console.print("\n[yellow]💾 Phase 2: Import en base de données...[/yellow]")
 
     batch_size = config.import_.batch_size
+    semaphore = asyncio.Semaphore(config.import_.num_workers)
+
+    async def import_batches(upsert, count, get_batch, progress, task):
+        """Batchs en parallèle (num_workers connexions à la fois); retourne les stats cumulées.
+
+        Chaque batch n'est matérialisé (get_batch) qu'une fois une connexion libre.
+        """
+        totals = {'inserted': 0, 'updated': 0, 'errors': 0}
+
+        async def run(start):
+            async with semaphore:
+                batch = get_batch(start, min(start + batch_size, count))
+                stats = await upsert(batch)
+            for key, value in stats.items():
+                totals[key] += value
+            progress.update(task, advance=min(batch_size, count - start))
+
+        await asyncio.gather(*(run(i) for i in range(0, count, batch_size)))
+        return totals
+
+    import_errors = 0
 
     # Import pays
     if parser.countries:
         with Progress(console=console) as progress:
             task = progress.add_task("Import pays", total=len(parser.countries))
-
-            for i in range(0, len(parser.countries), batch_size):
-                batch = parser.countries[i:i + batch_size]
-                await db_operations.upsert_countries(batch)
-                progress.update(task, advance=len(batch))
+            stats = await import_batches(db_operations.upsert_countries, len(parser.countries),
+                                         lambda start, stop: parser.countries[start:stop], progress, task)
+        import_errors += stats['errors']
 
     # Import villes
-    if parser.cities:
+    if len(parser.cities):
         with Progress(console=console) as progress:
             task = progress.add_task("Import villes", total=len(parser.cities))
-
-            for i in range(0, len(parser.cities), batch_size):
-                batch = parser.cities[i:i + batch_size]
-                await db_operations.upsert_cities(batch)
-                progress.update(task, advance=len(batch))
+            # Colonnes passées telles quelles au COPY (pas de dict par ville)
+            stats = await import_batches(db_operations.copy_cities, len(parser.cities),
+                                         lambda start, stop: parser.cities.select(start, stop, CITY_FIELDS),
+                                         progress, task)
+        import_errors += stats['errors']
 
     # Phase 3: Finalisation
     console.print("\n[yellow]🔗 Phase 3: Finalisation...[/yellow]")
@@ -166,6 +221,8 @@ async def fast_import(osm_file: Path, config_file: Path):
     console.print(f"[green]   🏙️  Villes: {stats['cities']:,}[/green]")
     console.print(f"[green]   🔗 Villes liées: {stats['linked_cities']:,}[/green]")
     console.print(f"[green]   ⚡ Vitesse moyenne: {parser.processed / total_time:.0f} éléments/s[/green]")
+    if import_errors:
+        console.print(f"[bold red]⚠️  {import_errors:,} lignes non importées (voir les erreurs ci-dessus)[/bold red]")
 
     await db_manager.close()
 
@@ -1,11 +1,20 @@
 from rich.progress import Progress, BarColumn, TextColumn, TimeElapsedColumn, TimeRemainingColumn
 from rich.console import Console
+from collections import defaultdict, deque
 from typing import Dict, Any
 import threading
 
+# Intervalle (secondes) entre deux prises en compte des avancements en attente
+REFRESH_INTERVAL = 0.1
+
 
 class ProgressTracker:
-    """Gestionnaire de barres de progression avec Rich."""
+    """Gestionnaire de barres de progression avec Rich.
+
+    Les avancements (`update(name, advance=...)`) sont empilés sans verrou
+    dans une deque (append atomique) et reportés dans Rich par un thread de
+    rafraîchissement toutes les REFRESH_INTERVAL secondes.
+    """
 
     def __init__(self):
         self.console = Console()
@@ -19,39 +28,71 @@ class ProgressTracker:
             console=self.console
         )
         self.tasks: Dict[str, Any] = {}
-        self._lock = threading.Lock()
+        self._pending = deque()  # (nom de tâche, avancement) pas encore reportés
+        self._stop_refresh = threading.Event()
+        self._refresher = None
 
     def add_task(self, name: str, description: str, total: int):
         """Ajoute une nouvelle tâche de progression."""
-        with self._lock:
-            task_id = self.progress.add_task(description, total=total)
-            self.tasks[name] = task_id
+        task_id = self.progress.add_task(description, total=total)
+        self.tasks[name] = task_id
         return task_id
 
     def update(self, name: str, advance: int = 1, completed: int = None, **kwargs):
         """Met à jour la progression d'une tâche."""
-        with self._lock:
-            if name in self.tasks:
-                if completed is not None:
-                    # Mettre à jour directement la valeur completed
-                    current_task = self.progress.tasks[self.tasks[name]]
-                    advance_value = completed - current_task.completed
-                    self.progress.update(self.tasks[name], advance=advance_value, **kwargs)
-                else:
-                    self.progress.update(self.tasks[name], advance=advance, **kwargs)
+        if name not in self.tasks:
+            return
+
+        if completed is None and not kwargs:
+            # Chemin courant: simple ajout, reporté par le thread de rafraîchissement
+            self._pending.append((name, advance))
+            return
+
+        # Valeur absolue ou autres champs: les avancements en attente passent avant
+        self._flush()
+        if completed is not None:
+            self.progress.update(self.tasks[name], completed=completed, **kwargs)
+        else:
+            self.progress.update(self.tasks[name], advance=advance, **kwargs)
 
     def update_total(self, name: str, new_total: int):
         """Met à jour le total d'une tâche."""
-        with self._lock:
-            if name in self.tasks:
-                self.progress.update(self.tasks[name], total=new_total)
+        if name in self.tasks:
+            self.progress.update(self.tasks[name], total=new_total)
+
+    def _flush(self):
+        """Reporte dans Rich les avancements en attente, cumulés par tâche."""
+        advances = defaultdict(int)
+        pending = self._pending
+        while pending:
+            try:
+                name, advance = pending.popleft()
+            except IndexError:
+                break
+            advances[name] += advance
+
+        for name, advance in advances.items():
+            self.progress.update(self.tasks[name], advance=advance)
+
+    def _refresh(self):
+        """Boucle du thread de rafraîchissement."""
+        while not self._stop_refresh.wait(REFRESH_INTERVAL):
+            self._flush()
 
     def start(self):
         """Démarre l'affichage des barres de progression."""
         self.progress.start()
+        self._stop_refresh.clear()
+        self._refresher = threading.Thread(target=self._refresh, daemon=True)
+        self._refresher.start()
 
     def stop(self):
         """Arrête l'affichage des barres de progression."""
+        if self._refresher is not None:
+            self._stop_refresh.set()
+            self._refresher.join()
+            self._refresher = None
+        self._flush()
         self.progress.stop()
 
     def __enter__(self):
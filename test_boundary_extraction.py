@@ -6,6 +6,13 @@ import os
 import logging
 from pathlib import Path
 
+# Union des anneaux par paquets au-delà de ce nombre d'anneaux (taille réglable)
+UNION_CASCADE_THRESHOLD = 500
+UNION_CHUNK_SIZE = int(os.environ.get('UNION_CHUNK_SIZE', 256))
+
+# GeoJSON indenté (débogage) seulement si GEOJSON_PRETTY=1: plus lent et ~2x plus gros
+GEOJSON_PRETTY = os.environ.get('GEOJSON_PRETTY') == '1'
+
 # Configuration logging
 logging.basicConfig(
     level=logging.INFO,
@@ -79,20 +86,21 @@ def list_countries_in_file(osm_file_path):
             self.countries = []
 
         def relation(self, r):
-            if (r.tags.get('boundary') == 'administrative' and
-                r.tags.get('admin_level') == '2'):
-
-                name = r.tags.get('name', f'Country {r.id}')
-                code = r.tags.get('ISO3166-1:alpha2', 'N/A')
+            name = r.tags.get('name', f'Country {r.id}')
+            code = r.tags.get('ISO3166-1:alpha2', 'N/A')
 
-                self.countries.append({
-                    'name': name,
-                    'code': code,
-                    'id': r.id
-                })
+            self.countries.append({
+                'name': name,
+                'code': code,
+                'id': r.id
+            })
 
+    # Seules les relations pays remontent en Python (filtrage C++)
     lister = CountryLister()
-    lister.apply_file(osm_file_path)
+    lister.apply_file(osm_file_path, filters=[
+        osmium.filter.TagFilter(('boundary', 'administrative')).enable_for(osmium.osm.RELATION),
+        osmium.filter.TagFilter(('admin_level', '2')).enable_for(osmium.osm.RELATION),
+    ])
 
     return sorted(lister.countries, key=lambda x: x['name'])
 
@@ -100,130 +108,107 @@ def list_countries_in_file(osm_file_path):
 def extract_single_country_boundary(osm_file_path, country_id):
     """Extrait la frontière d'un seul pays pour test."""
     import osmium
-    import json
-
-    class SingleCountryExtractor(osmium.SimpleHandler):
-        def __init__(self, target_country_id):
-            osmium.SimpleHandler.__init__(self)
-            self.target_country_id = target_country_id
-            self.target_ways = set()
-            self.target_nodes = set()
-            self.ways_data = {}
-            self.nodes_data = {}
-            self.country_name = None
-            self.pass_number = 1
-
-        def relation(self, r):
-            if self.pass_number == 1 and r.id == self.target_country_id:
-                self.country_name = r.tags.get('name', f'Country {r.id}')
-                print(f"   Trouvé relation pays: {self.country_name}")
-
-                # Collecter les ways
-                for member in r.members:
-                    if member.type == 'w':
-                        self.target_ways.add(member.ref)
-
-                print(f"   Ways à extraire: {len(self.target_ways)}")
-
-        def way(self, w):
-            if self.pass_number == 2 and w.id in self.target_ways:
-                node_refs = [node.ref for node in w.nodes]
-                self.ways_data[w.id] = node_refs
-                self.target_nodes.update(node_refs)
-
-        def node(self, n):
-            if self.pass_number == 3 and n.id in self.target_nodes:
-                self.nodes_data[n.id] = (n.location.lon, n.location.lat)
+    import orjson
+    import shapely
+    from shapely.geometry import LineString, mapping
+    from shapely.ops import polygonize, unary_union
+
+    # Chaque passe ne laisse remonter en Python que les IDs ciblés
+    # (EntityFilter + IdFilter côté C++): aucun test d'appartenance ici
+    def only(entity, ids):
+        return [osmium.filter.EntityFilter(entity),
+                osmium.filter.IdFilter(ids).enable_for(entity)]
+
+    def read(entities, filters, with_locations=False):
+        processor = osmium.FileProcessor(osm_file_path, entities)
+        if with_locations:
+            processor = processor.with_locations()
+        for osm_filter in filters:
+            processor = processor.with_filter(osm_filter)
+        return processor
+
+    country_name = None
+    target_ways = set()
+    ways_data = {}
+
+    # Passe 1: Trouver les ways (seules les relations sont lues)
+    print("   Passe 1: Identification des ways...")
+    for r in read(osmium.osm.RELATION, only(osmium.osm.RELATION, [country_id])):
+        country_name = r.tags.get('name', f'Country {r.id}')
+        print(f"   Trouvé relation pays: {country_name}")
 
-    extractor = SingleCountryExtractor(country_id)
+        # Collecter les ways
+        for member in r.members:
+            if member.type == 'w':
+                target_ways.add(member.ref)
 
-    # Passe 1: Trouver les ways
-    print("   Passe 1: Identification des ways...")
-    extractor.pass_number = 1
-    extractor.apply_file(osm_file_path)
+        print(f"   Ways à extraire: {len(target_ways)}")
 
-    if not extractor.target_ways:
+    if not target_ways:
         print("   ❌ Aucun way trouvé pour ce pays")
         return False
 
-    # Passe 2: Extraire les ways
-    print(f"   Passe 2: Extraction de {len(extractor.target_ways)} ways...")
-    extractor.pass_number = 2
-    extractor.apply_file(osm_file_path)
-
-    print(f"   Ways extraits: {len(extractor.ways_data)}")
-
-    # Calculer les nodes nécessaires
-    for way_nodes in extractor.ways_data.values():
-        extractor.target_nodes.update(way_nodes)
-
-    # Passe 3: Extraire les nodes
-    print(f"   Passe 3: Extraction de {len(extractor.target_nodes)} nodes...")
-    extractor.pass_number = 3
-    extractor.apply_file(osm_file_path)
+    # Passe 2: ways et nodes dans la même lecture, coordonnées des nodes
+    # résolues par le cache de positions d'osmium (C++)
+    print(f"   Passe 2: Extraction de {len(target_ways)} ways...")
+    for w in read(osmium.osm.NODE | osmium.osm.WAY, only(osmium.osm.WAY, target_ways),
+                  with_locations=True):
+        ways_data[w.id] = [
+            (node.location.lon, node.location.lat)
+            for node in w.nodes if node.location.valid()
+        ]
 
-    print(f"   Nodes extraits: {len(extractor.nodes_data)}")
+    print(f"   Ways extraits: {len(ways_data)}")
 
     # Construire la géométrie
     print("   Construction de la géométrie...")
 
-    all_coords = []
-    valid_ways = 0
-
-    for way_id, node_refs in extractor.ways_data.items():
-        way_coords = []
-        for node_ref in node_refs:
-            if node_ref in extractor.nodes_data:
-                way_coords.append(extractor.nodes_data[node_ref])
+    lines = []
 
+    for way_coords in ways_data.values():
         if len(way_coords) >= 2:
-            all_coords.extend(way_coords)
-            valid_ways += 1
+            lines.append(LineString(way_coords))
 
-    print(f"   Ways valides: {valid_ways}/{len(extractor.ways_data)}")
-    print(f"   Points totaux: {len(all_coords)}")
+    print(f"   Ways valides: {len(lines)}/{len(ways_data)}")
 
-    if len(all_coords) < 3:
-        print("   ❌ Pas assez de points pour un polygone")
+    # Anneaux reconstitués par GEOS (ways non ordonnés) puis fusion en un seul appel
+    rings = list(polygonize(lines))
+    if not rings:
+        print("   ❌ Aucun anneau fermé reconstitué")
         return False
 
-    # Nettoyer et fermer le polygone
-    unique_coords = [all_coords[0]]
-    for coord in all_coords[1:]:
-        if coord != unique_coords[-1]:
-            unique_coords.append(coord)
-
-    if unique_coords[0] != unique_coords[-1]:
-        unique_coords.append(unique_coords[0])
-
-    if len(unique_coords) < 4:
-        print("   ❌ Polygone trop petit après nettoyage")
-        return False
+    # Beaucoup d'anneaux: unions partielles par paquets puis union finale
+    if len(rings) > UNION_CASCADE_THRESHOLD:
+        geometry = unary_union([
+            unary_union(rings[i:i + UNION_CHUNK_SIZE])
+            for i in range(0, len(rings), UNION_CHUNK_SIZE)
+        ])
+    else:
+        geometry = unary_union(rings)
 
     # Créer le GeoJSON
     geojson = {
         "type": "Feature",
         "properties": {
-            "name": extractor.country_name,
+            "name": country_name,
             "osm_id": country_id
         },
-        "geometry": {
-            "type": "Polygon",
-            "coordinates": [[[lon, lat] for lon, lat in unique_coords]]
-        }
+        "geometry": mapping(geometry)
     }
 
     # Statistiques
-    lons = [coord[0] for coord in unique_coords]
-    lats = [coord[1] for coord in unique_coords]
+    min_lon, min_lat, max_lon, max_lat = geometry.bounds
 
-    print(f"   ✅ Polygone créé avec {len(unique_coords)} points")
-    print(f"   Bounding box: {min(lons):.3f},{min(lats):.3f} à {max(lons):.3f},{max(lats):.3f}")
+    print(f"   ✅ {geometry.geom_type} créé avec {len(rings)} anneaux, "
+          f"{shapely.get_num_coordinates(geometry)} points")
+    print(f"   Bounding box: {min_lon:.3f},{min_lat:.3f} à {max_lon:.3f},{max_lat:.3f}")
 
     # Sauvegarder
     output_file = f"test_boundary_{country_id}.geojson"
-    with open(output_file, 'w') as f:
-        json.dump(geojson, f, indent=2)
+    options = orjson.OPT_APPEND_NEWLINE | orjson.OPT_SERIALIZE_NUMPY
+    if GEOJSON_PRETTY:
+        options |= orjson.OPT_INDENT_2
+    Path(output_file).write_bytes(orjson.dumps(geojson, option=options))
 
     print(f"   💾 Frontière sauvegardée: {output_file}")
 